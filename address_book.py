@@ -1,8 +1,28 @@
-from collections import UserDict
+from array import array
+from collections import OrderedDict, UserDict, namedtuple
+from collections.abc import MutableMapping
+from contextlib import contextmanager, nullcontext
+from functools import cache
+import bisect
 import datetime
+import heapq
+import itertools
 import pickle
 import os
 import os.path
+import struct
+import threading
+
+import metrics
+
+
+@cache
+def import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
 
 
 class ValidationError(Exception):
@@ -12,9 +32,17 @@ class ValidationError(Exception):
 
 
 class Field:
+    __slots__ = ("__value",)
+
     def __init__(self, value=None):
         self.value = value
 
+    @classmethod
+    def _from_value(cls, value):
+        field = cls.__new__(cls)
+        field.__value = value
+        return field
+
     @property
     def value(self):
         return self.__value
@@ -48,79 +76,180 @@ class Field:
     def __contains__(self, value):
         return value in self.value
 
+    def __getstate__(self):
+        return (self.__value,)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            state = (state["_Field__value"],)
+        (self.__value,) = state
+
 
 class Name(Field):
-    pass
+    __slots__ = ()
+
+
+PHONE_SEPARATORS = b" ()-.\t\r\n"
 
 
 class Phone(Field):
+    __slots__ = ("_packed",)
+    default_country = None
+
+    @Field.value.setter
+    def value(self, value):
+        Field.value.fset(self, value)
+        self._packed = self.pack(self.value)
+
+    @property
+    def packed(self) -> int:
+        try:
+            return self._packed
+        except AttributeError:
+            self._packed = self.pack(self.value)
+            return self._packed
+
+    @staticmethod
+    def pack(value: str):
+        if value.isascii() and value.isdigit():
+            return int("1" + value)
+        # Books saved before phones were digits-only can still hold other text.
+        return value
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        if not (self.value.isascii() and self.value.isdigit()):
+            try:
+                self.value = self.value
+            except ValidationError:
+                pass
+
     def validate(self, value: str):
         if len(value) < 10:
             raise ValidationError(
                 Phone,
                 f"Length of the phone should be greater than 10. Your phone has only {len(value)} digits",
             )
+        if not (value.isascii() and value.isdigit()):
+            raise ValidationError(
+                Phone, f"Phone should contain digits only, got {value}"
+            )
 
     def sanitize(self, phone):
-        new_phone = (
-            phone.strip()
-            .removeprefix("+")
-            .replace("(", "")
-            .replace(")", "")
-            .replace("-", "")
-            .replace(" ", "")
-        )
-        return new_phone
+        if not phone.isdigit() and phone.isascii():
+            phone = phone.encode().translate(None, PHONE_SEPARATORS).decode()
+        if phone.startswith("+"):
+            return phone[1:]
+        if self.default_country:
+            if phone.startswith("00"):
+                return phone[2:]
+            if phone.startswith("0"):
+                return self.default_country + phone[1:]
+        return phone
+
+    def __hash__(self) -> int:
+        return hash(self.packed)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Phone):
+            return self.packed == other.packed
+        if isinstance(other, str):
+            try:
+                return self.packed == Phone(other).packed
+            except ValidationError:
+                return self.value == other
+        return NotImplemented
 
 
 class Birthday(Field):
+    __slots__ = ()
+
     def sanitize(self, value: str) -> datetime.date:
+        if isinstance(value, datetime.date):
+            return value
         try:
             return datetime.datetime.strptime(value, "%d/%m/%Y").date()
         except Exception as e:
             raise ValidationError(Birthday, str(e))
 
 
+def next_birthday(born: datetime.date, today: datetime.date) -> datetime.date:
+    for year in (today.year, today.year + 1):
+        try:
+            birthday = born.replace(year=year)
+        except ValueError:
+            birthday = datetime.date(year, 3, 1)
+        if birthday >= today:
+            return birthday
+
+
 class Record:
+    __slots__ = ("name", "_phones", "birthday", "_book")
+
     def __init__(self, name: Name, phone: Phone = None, birthday: Birthday = None):
+        self._book = None
         self.name = name
-        self.phones = []
-        if phone:
-            self.phones.append(phone)
+        self.phones = [phone] if phone else []
         self.birthday = birthday
 
+    @property
+    def phones(self) -> list[Phone]:
+        return self._phones
+
+    @phones.setter
+    def phones(self, phones):
+        self._phones = list(phones)
+
+    def _changing(self, field):
+        if self._book is None:
+            return nullcontext()
+        return self._book._changing(self, field)
+
     def add_phone(self, phone: Phone):
-        self.phones.append(phone)
+        with self._changing("phones"):
+            self.phones = [*self.phones, phone]
 
     def change_phone(self, old_phone: Phone, new_phone: Phone):
-        if not old_phone:
-            idx = 0
-        else:
-            idx = self.phones.index(old_phone)
-        self.phones[idx] = new_phone
+        with self._changing("phones"):
+            phones = list(self.phones)
+            if not old_phone:
+                idx = 0
+            else:
+                idx = phones.index(old_phone)
+            phones[idx] = new_phone
+            self.phones = phones
 
     def delete_phone(self, phone: Phone):
-        try:
-            self.phones.remove(phone)
-        except:
-            raise ValueError("Phone number doesn't exist")
+        with self._changing("phones"):
+            phones = list(self.phones)
+            try:
+                phones.remove(phone)
+            except:
+                raise ValueError("Phone number doesn't exist")
+            self.phones = phones
 
     def set_birthday(self, birthday: Birthday):
-        self.birthday = birthday
+        with self._changing("birthday"):
+            self.birthday = birthday
 
     def delete_birthday(self):
-        self.birthday = None
+        with self._changing("birthday"):
+            self.birthday = None
+
+    def __getstate__(self):
+        return {"name": self.name, "phones": self.phones, "birthday": self.birthday}
+
+    def __setstate__(self, state):
+        self._book = None
+        self.name = state["name"]
+        self.phones = state["phones"]
+        self.birthday = state["birthday"]
 
     def days_to_birthday(self):
         if not self.birthday:
             raise ValueError(f"Birthday is not defined for {self.name}")
         today = datetime.datetime.now().date()
-        birthday = self.birthday.value.replace(year=today.year)
-        if birthday >= today:
-            difference = (birthday - today).days
-        else:
-            difference = (self.birthday.value.replace(year=today.year + 1) - today).days
-        return difference
+        return (next_birthday(self.birthday.value, today) - today).days
 
     def __str__(self) -> str:
         phones = ", ".join([str(phone) for phone in self.phones])
@@ -142,61 +271,1181 @@ class Record:
         return False
 
 
+def pack_phone(phone: Phone) -> int:
+    value = phone.value
+    if not value.isdigit() or len(value) > 18:
+        raise ValidationError(
+            Phone, f"Compact storage supports up to 18 digits only, got {value}"
+        )
+    return phone.packed
+
+
+def unpack_phone(packed: int) -> Phone:
+    phone = Phone._from_value(str(packed)[1:])
+    phone._packed = packed
+    return phone
+
+
+class CompactRecord(Record):
+    __slots__ = ()
+
+    @property
+    def phones(self) -> list[Phone]:
+        return [unpack_phone(packed) for packed in self._phones]
+
+    @phones.setter
+    def phones(self, phones):
+        self._phones = array("q", [pack_phone(phone) for phone in phones])
+
+
 class PaginationIterator:
     def __init__(self, iterator, N=5):
         self.iterator = iterator
         self.N = N
+        self.pages = []
+        self.current = -1
+
+    def __iter__(self):
+        return self
 
     def __next__(self):
+        if self.current + 1 < len(self.pages):
+            self.current += 1
+            return self.pages[self.current]
         values = []
         for i in range(self.N):
             try:
                 values.append(next(self.iterator))
             except StopIteration:
                 if values:
-                    return values
+                    break
                 raise StopIteration
+        self.pages.append(values)
+        self.current += 1
         return values
 
+    def prev(self):
+        if self.current <= 0:
+            raise StopIteration
+        self.current -= 1
+        return self.pages[self.current]
+
+    def page(self, number):
+        if number < 1:
+            raise StopIteration
+        current = self.current
+        try:
+            while len(self.pages) < number:
+                self.current = len(self.pages) - 1
+                next(self)
+        finally:
+            self.current = current
+        self.current = number - 1
+        return self.pages[self.current]
+
+
+class SortedSource:
+    def after(self, key, n):
+        i = 0 if key is None else bisect.bisect_right(self.keys, key)
+        return list(zip(self.keys[i : i + n], self.items[i : i + n]))
+
+    def before(self, key, n):
+        i = bisect.bisect_left(self.keys, key)
+        return list(zip(self.keys[max(0, i - n) : i], self.items[max(0, i - n) : i]))
+
+    def at(self, position, n):
+        return list(
+            zip(self.keys[position : position + n], self.items[position : position + n])
+        )
+
+
+class KeyRange:
+    def __init__(self, index, start=None, end=None, resolve=None):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.resolve = resolve
+
+    def bounds(self):
+        keys = self.index.keys
+        lo = 0 if self.start is None else bisect.bisect_left(keys, self.start)
+        hi = len(keys) if self.end is None else bisect.bisect_left(keys, self.end)
+        return lo, hi
+
+    def _items(self, i, j):
+        items = zip(self.index.keys[i:j], self.index.items[i:j])
+        return [(key, self.resolve(item)) for (key, item) in items]
+
+    def after(self, key, n):
+        lo, hi = self.bounds()
+        i = lo if key is None else max(lo, bisect.bisect_right(self.index.keys, key))
+        return self._items(i, min(i + n, hi))
+
+    def before(self, key, n):
+        lo, hi = self.bounds()
+        i = min(bisect.bisect_left(self.index.keys, key), hi)
+        return self._items(max(lo, i - n), i)
+
+    def at(self, position, n):
+        lo, hi = self.bounds()
+        return self._items(lo + position, min(lo + position + n, hi))
+
+    def __iter__(self):
+        lo, hi = self.bounds()
+        return (record for (_, record) in self._items(lo, hi))
+
+
+class ListSource(SortedSource):
+    def __init__(self, items):
+        self.keys = range(len(items))
+        self.items = items
+
+
+class Cursor:
+    def __init__(self, source, N=5, resolve=None):
+        self.source = source
+        self.N = N
+        self.resolve = resolve
+        self.first = None
+        self.last = None
+
+    def __iter__(self):
+        return self
+
+    def _show(self, items):
+        if not items:
+            raise StopIteration
+        self.first, self.last = items[0][0], items[-1][0]
+        if self.resolve is None:
+            return [item for (_, item) in items]
+        return [self.resolve(item) for (_, item) in items]
+
+    def __next__(self):
+        return self._show(self.source.after(self.last, self.N))
+
+    def prev(self):
+        if self.first is None:
+            raise StopIteration
+        return self._show(self.source.before(self.first, self.N))
+
+    def page(self, number):
+        if number < 1:
+            raise StopIteration
+        return self._show(self.source.at((number - 1) * self.N, self.N))
+
 
 class AddressBookView:
     def __init__(self, iter):
         self.iter = iter
 
+    def pages(self, N=5):
+        if isinstance(self.iter, list):
+            return Cursor(ListSource(self.iter), N)
+        if hasattr(self.iter, "after"):
+            return Cursor(self.iter, N)
+        return PaginationIterator(self.iter, N)
+
     def __iter__(self):
-        return PaginationIterator(self.iter)
+        return self.pages()
+
+
+class Index:
+    fields = ()
+
+    def build(self, records):
+        for record in records:
+            self.insert(record)
+
+    def insert(self, record: Record):
+        pass
+
+    def remove(self, record: Record):
+        pass
+
+
+class InsertionOrder(Index, SortedSource):
+    def __init__(self):
+        self.seq = {}
+        self.keys = []
+        self.items = []
+        self.counter = 0
+
+    def insert(self, record: Record):
+        self.seq[record.name] = self.counter
+        self.keys.append(self.counter)
+        self.items.append(record.name)
+        self.counter += 1
+
+    def remove(self, record: Record):
+        seq = self.seq.pop(record.name, None)
+        if seq is None:
+            return
+        i = bisect.bisect_left(self.keys, seq)
+        del self.keys[i]
+        del self.items[i]
+
+    def sort(self, records):
+        return sorted(records, key=lambda record: self.seq[record.name])
+
+
+class PhoneIndex(Index):
+    fields = ("phones",)
+
+    def __init__(self):
+        self.records = {}
+
+    def insert(self, record: Record):
+        for phone in record.phones:
+            self.records.setdefault(phone.packed, {})[record.name] = record
+
+    def remove(self, record: Record):
+        for phone in record.phones:
+            records = self.records.get(phone.packed)
+            if records is None:
+                continue
+            records.pop(record.name, None)
+            if not records:
+                del self.records[phone.packed]
+
+    def lookup(self, phone: Phone) -> list[Record]:
+        return list(self.records.get(phone.packed, {}).values())
+
+
+class NameIndex(Index):
+    def __init__(self):
+        self.keys = []
+        self.items = []
+
+    def build(self, records):
+        items = sorted((record.name.value, record.name) for record in records)
+        self.keys = [key for key, _ in items]
+        self.items = [name for _, name in items]
+
+    def insert(self, record: Record):
+        key = record.name.value
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.items.insert(i, record.name)
+
+    def remove(self, record: Record):
+        key = record.name.value
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+            del self.items[i]
+
+    def range(self, start=None, end=None, resolve=None):
+        return KeyRange(self, start, end, resolve)
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex(Index):
+    max_distance = 2
+    prefix_length = 7
+    max_corrections = 3
+    max_candidates = 1000
+    background_size = 10000
+
+    def __init__(self):
+        self.postings = {}
+        self.deletes = {}
+
+    def variants(self, word: str):
+        word = word[: self.prefix_length]
+        variants = {word}
+
+        def delete(word, distance, start):
+            for i in range(start, len(word)):
+                variant = word[:i] + word[i + 1 :]
+                variants.add(variant)
+                if distance > 1:
+                    delete(variant, distance - 1, i)
+
+        delete(word, self.max_distance, 0)
+        return variants
+
+    def build(self, records):
+        self.build_names(record.name for record in records)
+
+    def build_names(self, names):
+        for name in names:
+            self.add(getattr(name, "value", name))
+
+    def insert(self, record: Record):
+        self.add(record.name.value)
+
+    def remove(self, record: Record):
+        self.discard(record.name.value)
+
+    # A word used by a single name maps straight to it; most words in a large
+    # book (numbers, rare surnames) are unique and a set each would triple
+    # the index size.
+    def add(self, name: str):
+        for word in set(name.casefold().split()):
+            names = self.postings.get(word)
+            if isinstance(names, set):
+                names.add(name)
+            elif names is not None:
+                self.postings[word] = {names, name}
+            else:
+                self.postings[word] = name
+                if not word.isdigit():
+                    for variant in self.variants(word):
+                        self.deletes.setdefault(variant, set()).add(word)
+
+    def discard(self, name: str):
+        for word in set(name.casefold().split()):
+            names = self.postings.get(word)
+            if isinstance(names, set):
+                names.discard(name)
+                if names:
+                    continue
+            elif names != name:
+                continue
+            del self.postings[word]
+            if not word.isdigit():
+                for variant in self.variants(word):
+                    words = self.deletes.get(variant)
+                    if words is not None:
+                        words.discard(word)
+                        if not words:
+                            del self.deletes[variant]
+
+    def names(self, word: str) -> set:
+        names = self.postings[word]
+        return names if isinstance(names, set) else {names}
+
+    def corrections(self, word: str, max_distance: int):
+        # Digits are matched exactly: typo variants of every number in a large
+        # book would dwarf the rest of the index.
+        if word.isdigit() or max_distance <= 0:
+            return [(0, word)] if word in self.postings else []
+        candidates = set()
+        for variant in self.variants(word):
+            candidates |= self.deletes.get(variant, set())
+        corrections = []
+        for candidate in candidates:
+            distance = edit_distance(word, candidate, max_distance)
+            if distance <= max_distance:
+                corrections.append((distance, candidate))
+        corrections.sort()
+        return corrections[: self.max_corrections]
+
+    def combinations(self, choices, budget: int):
+        if not choices:
+            yield 0, ()
+            return
+        for distance, word in choices[0]:
+            if distance <= budget:
+                rest = self.combinations(choices[1:], budget - distance)
+                for rest_distance, words in rest:
+                    yield distance + rest_distance, (word, *words)
+
+    def lookup(self, query: str, max_distance: int = None, limit: int = None):
+        if max_distance is None:
+            max_distance = self.max_distance
+        if limit is None or limit > self.max_candidates:
+            limit = self.max_candidates
+        words = query.casefold().split()
+        choices = [self.corrections(word, max_distance) for word in words]
+        if not words or not all(choices):
+            return []
+        matches = []
+        seen = set()
+        for _, combination in sorted(self.combinations(choices, max_distance)):
+            if len(matches) >= limit:
+                break
+            postings = sorted(map(self.names, combination), key=len)
+            names = postings[0].intersection(*postings[1:])
+            names -= seen
+            for name in heapq.nsmallest(limit - len(matches), names):
+                seen.add(name)
+                matches.append(name)
+        return matches
+
+
+class FuzzyBuild:
+    def __init__(self, names):
+        self.index = FuzzyIndex()
+        self.changed = set()
+        self.thread = threading.Thread(target=self.run, args=(names,), daemon=True)
+        self.thread.start()
+
+    def run(self, names):
+        self.index.build_names(names)
+
+    def finish(self, data) -> FuzzyIndex:
+        self.thread.join()
+        for name in self.changed:
+            name = getattr(name, "value", name)
+            self.index.discard(name)
+            if name in data:
+                self.index.add(name)
+        return self.index
+
+
+def prefix_end(prefix: str):
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class TrigramIndex(Index):
+    fields = ("phones",)
+    N = 3
+
+    def __init__(self):
+        self.postings = {}
+
+    def grams(self, text: str):
+        return {text[i : i + self.N] for i in range(len(text) - self.N + 1)}
+
+    def record_grams(self, record: Record):
+        grams = self.grams(record.name.value)
+        for phone in record.phones:
+            grams |= self.grams(phone.value)
+        return grams
+
+    def insert(self, record: Record):
+        for gram in self.record_grams(record):
+            self.postings.setdefault(gram, set()).add(record.name)
+
+    def remove(self, record: Record):
+        for gram in self.record_grams(record):
+            names = self.postings.get(gram)
+            if names is None:
+                continue
+            names.discard(record.name)
+            if not names:
+                del self.postings[gram]
+
+    def candidates(self, value: str):
+        if len(value) < self.N:
+            return None
+        postings = []
+        for gram in self.grams(value):
+            names = self.postings.get(gram)
+            if not names:
+                return set()
+            postings.append(names)
+        postings.sort(key=len)
+        return set.intersection(*postings)
+
+
+class BirthdayIndex(Index):
+    fields = ("birthday",)
+
+    def __init__(self):
+        self.keys = []
+
+    def key(self, record: Record):
+        birthday = record.birthday.value
+        return (birthday.month, birthday.day, record.name.value)
+
+    def build(self, records):
+        self.keys = sorted(
+            self.key(record) for record in records if record.birthday is not None
+        )
+
+    def insert(self, record: Record):
+        if record.birthday is not None:
+            bisect.insort(self.keys, self.key(record))
+
+    def remove(self, record: Record):
+        if record.birthday is not None:
+            key = self.key(record)
+            idx = bisect.bisect_left(self.keys, key)
+            if idx < len(self.keys) and self.keys[idx] == key:
+                del self.keys[idx]
+
+    def between(self, start: tuple, end: tuple) -> list[str]:
+        lo = bisect.bisect_left(self.keys, start)
+        hi = bisect.bisect_right(self.keys, end + (chr(0x10FFFF),))
+        return [name for (_, _, name) in self.keys[lo:hi]]
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class QueryCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def invalidate(self):
+        self.generation += 1
+
+    def get(self, key, compute):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == self.generation:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self.generation
+        value = compute()
+        if self.maxsize <= 0:
+            return value
+        with self.lock:
+            self.entries[key] = (generation, value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.entries))
+
+
+MONTH_STARTS = [1, 32, 61, 92, 122, 153, 183, 214, 245, 275, 306, 336]
+
+
+def birthday_ordinal(month: int, day: int) -> int:
+    return MONTH_STARTS[month - 1] + day - 1
+
+
+class BirthdayColumns(Index):
+    fields = ("birthday",)
+
+    def __init__(self):
+        self.names = []
+        self.positions = {}
+        self.ordinals = array("H")
+
+    def insert(self, record: Record):
+        if record.birthday is not None:
+            birthday = record.birthday.value
+            self.positions[record.name.value] = len(self.names)
+            self.names.append(record.name.value)
+            self.ordinals.append(birthday_ordinal(birthday.month, birthday.day))
+
+    def remove(self, record: Record):
+        position = self.positions.pop(record.name.value, None)
+        if position is None:
+            return
+        name = self.names.pop()
+        ordinal = self.ordinals.pop()
+        if position < len(self.names):
+            self.names[position] = name
+            self.ordinals[position] = ordinal
+            self.positions[name] = position
+
+    def days_to_birthday(self, today: datetime.date):
+        import calendar
+
+        this_year = 0 if calendar.isleap(today.year) else 1
+        next_year = 0 if calendar.isleap(today.year + 1) else 1
+        rest = (datetime.date(today.year, 12, 31) - today).days
+        today = today.timetuple().tm_yday
+        numpy = import_numpy()
+        if numpy is not None:
+            ordinals = numpy.frombuffer(self.ordinals, dtype=numpy.uint16).astype(
+                numpy.int32
+            )
+            shifted = ordinals > 60
+            days = ordinals - shifted * this_year - today
+            return numpy.where(days >= 0, days, ordinals - shifted * next_year + rest)
+        days = array("H")
+        for ordinal in self.ordinals:
+            shifted = ordinal > 60
+            day = ordinal - shifted * this_year - today
+            days.append(day if day >= 0 else ordinal - shifted * next_year + rest)
+        return days
+
+    def histogram(self) -> list[int]:
+        numpy = import_numpy()
+        if numpy is not None:
+            ordinals = numpy.frombuffer(self.ordinals, dtype=numpy.uint16)
+            months = numpy.searchsorted(MONTH_STARTS, ordinals, side="right") - 1
+            return numpy.bincount(months, minlength=12).tolist()
+        counts = [0] * 12
+        for ordinal in self.ordinals:
+            counts[bisect.bisect_right(MONTH_STARTS, ordinal) - 1] += 1
+        return counts
 
 
 class AddressBook(UserDict[Name, Record]):
+    record_class = Record
+
+    def __init__(self, *args, compact=False, cache_size=128, **kwargs):
+        self._indexes = {}
+        self._fuzzy_build = None
+        self._fuzzy_lock = threading.Lock()
+        self._cache = QueryCache(cache_size)
+        self.changes = set()
+        self.autosave = None
+        if compact:
+            self.record_class = CompactRecord
+        super().__init__(*args, **kwargs)
+
+    def _index(self, cls):
+        index = self._indexes.get(cls)
+        if index is None:
+            make_index = getattr(self.data, "make_index", None)
+            index = make_index(cls) if make_index else None
+            if index is None:
+                index = cls()
+                index.build(self.data.values())
+            self._indexes[cls] = index
+        return index
+
+    def _fuzzy_index(self, wait=True):
+        index = self._indexes.get(FuzzyIndex)
+        if index is not None:
+            return index
+        with self._fuzzy_lock:
+            index = self._indexes.get(FuzzyIndex)
+            if index is not None:
+                return index
+            build = self._fuzzy_build
+            if build is None:
+                names = list(self.data)
+                if len(names) <= FuzzyIndex.background_size:
+                    index = self._indexes[FuzzyIndex] = FuzzyIndex()
+                    index.build_names(names)
+                    return index
+                build = self._fuzzy_build = FuzzyBuild(names)
+            if not wait and build.thread.is_alive():
+                return None
+            index = self._indexes[FuzzyIndex] = build.finish(self.data)
+            self._fuzzy_build = None
+            return index
+
+    @contextmanager
+    def _changing(self, record: Record, field: str):
+        affected = [i for i in self._indexes.values() if field in i.fields]
+        for index in affected:
+            index.remove(record)
+        try:
+            yield
+        finally:
+            for index in affected:
+                index.insert(record)
+        self.data[record.name] = record
+        self._changed(record.name)
+
+    def _changed(self, name: Name):
+        self.changes.add(name)
+        if self._fuzzy_build is not None:
+            self._fuzzy_build.changed.add(name)
+        self._cache.invalidate()
+        if self.autosave is not None:
+            self.autosave.changed()
+
+    def __setitem__(self, name: Name, record: Record):
+        if name in self.data:
+            del self[name]
+        record._book = self
+        self.data[name] = record
+        for index in self._indexes.values():
+            index.insert(record)
+        self._changed(name)
+
+    def __delitem__(self, name: Name):
+        record = self.data[name]
+        for index in self._indexes.values():
+            index.remove(record)
+        del self.data[name]
+        record._book = None
+        self._changed(name)
+
+    def __getitem__(self, name: Name) -> Record:
+        record = self.data[name]
+        record._book = self
+        return record
+
     def add_record(self, record: Record):
         if record.name in self.data:
             raise ValueError(f"{record.name} already exists")
-        self.data[record.name] = record
+        self[record.name] = record
 
     def delete_record(self, name: Name):
-        self.data.pop(name)
+        del self[name]
 
     def get_record(self, name: Name) -> Record:
-        return self.data[name]
+        return self[name]
 
     def search_record_by_phone(self, phone: Phone) -> AddressBookView:
-        return AddressBookView(filter(lambda x: phone in x.phones, self.data.values()))
+        if not isinstance(phone, Phone):
+            try:
+                phone = Phone(phone)
+            except ValidationError:
+                return AddressBookView([])
+        key = ("phone", phone.packed)
+        return AddressBookView(
+            self._cache.get(key, lambda: self._search_record_by_phone(phone))
+        )
+
+    def _search_record_by_phone(self, phone: Phone) -> list[Record]:
+        records = self._index(PhoneIndex).lookup(phone)
+        if len(records) > 1:
+            records = self._index(InsertionOrder).sort(records)
+        return records
+
+    def find(self, name, max_distance: int = None) -> AddressBookView:
+        names = self._fuzzy_index().lookup(str(name), max_distance)
+        return AddressBookView([self.data[name] for name in names])
+
+    def suggest(self, name, limit: int = 3) -> list[str]:
+        index = self._fuzzy_index(wait=False)
+        if index is None:
+            return []
+        return index.lookup(str(name), limit=limit)
+
+    def names_between(self, start: str = None, end: str = None) -> AddressBookView:
+        return AddressBookView(
+            self._index(NameIndex).range(start, end, resolve=self.data.__getitem__)
+        )
+
+    def starts_with(self, prefix: str) -> AddressBookView:
+        return self.names_between(prefix or None, prefix_end(prefix))
+
+    def upcoming_birthdays(
+        self, days: int, today: datetime.date = None
+    ) -> AddressBookView:
+        import calendar
+
+        if today is None:
+            today = datetime.datetime.now().date()
+        if days < 0:
+            return AddressBookView([])
+        end = today + datetime.timedelta(days=days)
+        start = (today.month, today.day)
+        if start == (3, 1) and not calendar.isleap(today.year):
+            start = (2, 29)
+        index = self._index(BirthdayIndex)
+        if days >= 365:
+            names = index.between((1, 1), (12, 31))
+        elif end.year == today.year:
+            names = index.between(start, (end.month, end.day))
+        else:
+            names = index.between(start, (12, 31)) + index.between(
+                (1, 1), (end.month, end.day)
+            )
+        upcoming = []
+        for name in names:
+            record = self.data[name]
+            birthday = next_birthday(record.birthday.value, today)
+            if birthday <= end:
+                upcoming.append((birthday, record))
+        upcoming.sort(key=lambda item: item[0])
+        return AddressBookView([record for (_, record) in upcoming])
+
+    def days_to_birthday_all(self, today: datetime.date = None) -> dict[str, int]:
+        if today is None:
+            today = datetime.datetime.now().date()
+        index = self._index(BirthdayColumns)
+        return dict(zip(index.names, index.days_to_birthday(today).tolist()))
+
+    def birthday_histogram(self) -> list[int]:
+        return self._index(BirthdayColumns).histogram()
+
+    def bulk_add(self, rows, batch_size=1000):
+        added = 0
+        errors = []
+        rows = enumerate(rows, start=1)
+        while batch := list(itertools.islice(rows, batch_size)):
+            records = []
+            names = set()
+            for row_number, (name, phones, birthday) in batch:
+                try:
+                    record = self.record_class(
+                        Name(name), birthday=Birthday(birthday) if birthday else None
+                    )
+                    record.phones = [Phone(phone) for phone in phones]
+                    if record.name in self.data or record.name in names:
+                        raise ValueError(f"{record.name} already exists")
+                except (ValueError, ValidationError) as e:
+                    errors.append((row_number, e))
+                    continue
+                names.add(record.name)
+                records.append(record)
+            for record in records:
+                self[record.name] = record
+            added += len(records)
+        return added, errors
+
+    def export(self, stream, fmt="csv") -> int:
+        rows = (
+            (
+                record.name.value,
+                [phone.value for phone in record.phones],
+                record.birthday.value.strftime("%d/%m/%Y") if record.birthday else None,
+            )
+            for record in self.data.values()
+        )
+        if fmt == "csv":
+            import csv
+
+            writer = csv.writer(stream)
+            writer.writerow(["name", "phones", "birthday"])
+            lines = (
+                writer.writerow([name, ";".join(phones), birthday or ""])
+                for (name, phones, birthday) in rows
+            )
+        elif fmt == "jsonl":
+            import json
+
+            lines = (
+                stream.write(
+                    json.dumps({"name": name, "phones": phones, "birthday": birthday})
+                    + "\n"
+                )
+                for (name, phones, birthday) in rows
+            )
+        else:
+            raise ValueError(f"Unknown format {fmt}, please use one of: csv, jsonl")
+        return sum(1 for _ in lines)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.changes)
 
     def save_to_file(self, store):
-        store.dump(self.data)
+        changes, self.changes = self.changes, set()
+        try:
+            with metrics.REGISTRY.timed("store", f"{store.__class__.__name__}.dump"):
+                store.dump(self.data)
+        except:
+            self.changes |= changes
+            raise
+
+    def save_changes(self, store):
+        changes, self.changes = self.changes, set()
+        try:
+            with metrics.REGISTRY.timed(
+                "store", f"{store.__class__.__name__}.save_changes"
+            ):
+                store.save_changes(self.data, changes)
+        except:
+            self.changes |= changes
+            raise
 
     def read_from_file(self, store):
-        self.data = store.load()
+        with metrics.REGISTRY.timed("store", f"{store.__class__.__name__}.load"):
+            self.data = store.load()
+        self._bind()
+        self._indexes = {}
+        self._fuzzy_build = None
+        self._cache.invalidate()
+        self.changes = set()
+
+    def _bind(self):
+        bind = getattr(self.data, "bind", None)
+        if bind is not None:
+            bind(self)
+        else:
+            for record in self.data.values():
+                record._book = self
 
     def search(self, value: str):
-        return AddressBookView(filter(lambda x: x.match(value), self.data.values()))
+        return AddressBookView(
+            self._cache.get(("search", str(value)), lambda: self._search(value))
+        )
+
+    def _search(self, value: str) -> list[Record]:
+        names = self._index(TrigramIndex).candidates(value)
+        if names is None:
+            return [record for record in self.data.values() if record.match(value)]
+        records = [self.data[name] for name in names]
+        records = [record for record in records if record.match(value)]
+        return self._index(InsertionOrder).sort(records)
+
+    def cache_info(self) -> CacheInfo:
+        return self._cache.info()
+
+    def pages(self, N=5):
+        if isinstance(self.data, dict) or hasattr(self.data, "make_index"):
+            return Cursor(self._index(InsertionOrder), N, resolve=self.data.__getitem__)
+        return PaginationIterator(iter(self.data.values()), N)
 
     def __iter__(self):
-        return PaginationIterator(iter(self.data.values()))
+        return self.pages()
+
+
+class ReadWriteLock:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.readers = 0
+        self.writer = None
+        self.writes = 0
+        self.writers_waiting = 0
+        self.local = threading.local()
+
+    @contextmanager
+    def reading(self):
+        depth = getattr(self.local, "reads", 0)
+        if depth or self.writer == threading.get_ident():
+            self.local.reads = depth + 1
+            try:
+                yield
+            finally:
+                self.local.reads = depth
+            return
+        with self.cond:
+            while self.writer is not None or self.writers_waiting:
+                self.cond.wait()
+            self.readers += 1
+        self.local.reads = 1
+        try:
+            yield
+        finally:
+            self.local.reads = 0
+            with self.cond:
+                self.readers -= 1
+                if not self.readers:
+                    self.cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        me = threading.get_ident()
+        with self.cond:
+            if self.writer != me:
+                if getattr(self.local, "reads", 0):
+                    raise RuntimeError("Cannot upgrade a read lock to a write lock")
+                self.writers_waiting += 1
+                while self.writer is not None or self.readers:
+                    self.cond.wait()
+                self.writers_waiting -= 1
+                self.writer = me
+            self.writes += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writes -= 1
+                if not self.writes:
+                    self.writer = None
+                    self.cond.notify_all()
+
+
+class ConcurrentAddressBook(AddressBook):
+    def __init__(self, *args, **kwargs):
+        self.lock = ReadWriteLock()
+        self._index_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _index(self, cls):
+        index = self._indexes.get(cls)
+        if index is None:
+            with self._index_lock:
+                index = super()._index(cls)
+        return index
+
+    @contextmanager
+    def _changing(self, record: Record, field: str):
+        with self.lock.writing(), super()._changing(record, field):
+            yield
+
+    def _snapshot(self, view: AddressBookView) -> AddressBookView:
+        return AddressBookView(list(view.iter))
+
+    def __setitem__(self, name: Name, record: Record):
+        with self.lock.writing():
+            super().__setitem__(name, record)
+
+    def __delitem__(self, name: Name):
+        with self.lock.writing():
+            super().__delitem__(name)
+
+    def __getitem__(self, name: Name) -> Record:
+        with self.lock.reading():
+            return super().__getitem__(name)
+
+    def __contains__(self, name) -> bool:
+        with self.lock.reading():
+            return name in self.data
+
+    def __len__(self) -> int:
+        with self.lock.reading():
+            return len(self.data)
+
+    def add_record(self, record: Record):
+        with self.lock.writing():
+            super().add_record(record)
+
+    def bulk_add(self, rows, batch_size=1000):
+        with self.lock.writing():
+            return super().bulk_add(rows, batch_size)
+
+    def search_record_by_phone(self, phone: Phone) -> AddressBookView:
+        with self.lock.reading():
+            return self._snapshot(super().search_record_by_phone(phone))
+
+    def search(self, value: str) -> AddressBookView:
+        with self.lock.reading():
+            return self._snapshot(super().search(value))
+
+    def find(self, name, max_distance: int = None) -> AddressBookView:
+        with self.lock.reading():
+            return self._snapshot(super().find(name, max_distance))
+
+    def suggest(self, name, limit: int = 3) -> list[str]:
+        with self.lock.reading():
+            return super().suggest(name, limit)
+
+    def names_between(self, start: str = None, end: str = None) -> AddressBookView:
+        with self.lock.reading():
+            return self._snapshot(super().names_between(start, end))
+
+    def upcoming_birthdays(self, days: int, today: datetime.date = None):
+        with self.lock.reading():
+            return self._snapshot(super().upcoming_birthdays(days, today))
+
+    def days_to_birthday_all(self, today: datetime.date = None) -> dict[str, int]:
+        with self.lock.reading():
+            return super().days_to_birthday_all(today)
+
+    def birthday_histogram(self) -> list[int]:
+        with self.lock.reading():
+            return super().birthday_histogram()
+
+    def export(self, stream, fmt="csv") -> int:
+        with self.lock.reading():
+            return super().export(stream, fmt)
+
+    def save_to_file(self, store):
+        with self.lock.reading():
+            super().save_to_file(store)
+
+    def save_changes(self, store):
+        with self.lock.reading():
+            super().save_changes(store)
+
+    def read_from_file(self, store):
+        with self.lock.writing():
+            super().read_from_file(store)
+
+    def pages(self, N=5):
+        with self.lock.reading():
+            return AddressBookView(list(self.data.values())).pages(N)
+
+
+def read_csv(stream):
+    import csv
+
+    for row in csv.reader(stream):
+        if not row or [c.strip().lower() for c in row] == [
+            "name",
+            "phones",
+            "birthday",
+        ]:
+            continue
+        row += [""] * (3 - len(row))
+        name, phones, birthday = (c.strip() for c in row[:3])
+        yield name, [p for p in phones.split(";") if p.strip()], birthday
+
+
+def _vcard_birthday(value: str):
+    for fmt in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return value
+
+
+def read_vcard(stream):
+    lines = []
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and lines:
+            lines[-1] += line[1:]
+        else:
+            lines.append(line)
+    name, phones, birthday = "", [], None
+    for line in lines:
+        key, _, value = line.partition(":")
+        key = key.split(";")[0].upper()
+        if key == "BEGIN":
+            name, phones, birthday = "", [], None
+        elif key == "FN":
+            name = value.strip()
+        elif key == "N" and not name:
+            parts = value.split(";")
+            name = " ".join(p for p in parts[1::-1] if p).strip()
+        elif key == "TEL":
+            phones.append(value.strip())
+        elif key == "BDAY":
+            birthday = _vcard_birthday(value.strip())
+        elif key == "END":
+            yield name, phones, birthday
+
+
+class AutoSave:
+    def __init__(self, book: AddressBook, store, interval=5.0, every=100):
+        self.book = book
+        self.store = store
+        self.interval = interval
+        self.every = every
+        self.pending = 0
+        self.error = None
+        self.stopping = False
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.book.autosave = self
+        self.thread.start()
+        return self
+
+    def changed(self):
+        self.pending += 1
+        if self.pending >= self.every:
+            self.wakeup.set()
+
+    def run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.pending = 0
+            if not self.book.dirty:
+                return
+            try:
+                self.book.save_changes(self.store)
+                self.error = None
+            except Exception as e:
+                self.error = e
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+        self.thread.join()
+        self.book.autosave = None
 
 
 class Store:
-    pass
+    def save_changes(self, data, changes):
+        self.dump(data)
 
 
 class PickleStore(Store):
@@ -204,9 +1453,12 @@ class PickleStore(Store):
         self.file = file
 
     def dump(self, data):
-        with open(self.file, "wb") as fh:
+        if type(data) is not dict:
+            data = dict(data)
+        tmp = self.file + ".tmp"
+        with open(tmp, "wb") as fh:
             pickle.dump(data, fh)
-        return
+        os.replace(tmp, self.file)
 
     def load(self) -> AddressBook:
         if os.path.exists(self.file):
@@ -217,3 +1469,626 @@ class PickleStore(Store):
                 os.remove(self.file)
                 return {}
         return {}
+
+
+class JournalRecords(dict):
+    def __init__(self, data, store):
+        super().__init__(data)
+        self.store = store
+
+    def __setitem__(self, name, record):
+        super().__setitem__(name, record)
+        self.store.append(self, ("put", name, record))
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self.store.append(self, ("del", name, None))
+
+
+class JournalStore(Store):
+    def __init__(self, file, compact_every=10000):
+        self.file = file
+        self.log_file = file + ".log"
+        self.rotated_file = file + ".log.1"
+        self.compact_every = compact_every
+        self.entries = 0
+        self.log = None
+        self.compaction = None
+
+    def append(self, data, entry):
+        if self.log is None:
+            self.log = open(self.log_file, "ab")
+        pickle.dump(entry, self.log)
+        self.log.flush()
+        self.entries += 1
+        if self.entries >= self.compact_every:
+            self.compact(data)
+
+    def replay(self, path, data):
+        if not os.path.exists(path):
+            return 0
+        entries = 0
+        with open(path, "r+b") as fh:
+            while True:
+                offset = fh.tell()
+                try:
+                    op, name, record = pickle.load(fh)
+                except Exception:
+                    break
+                if op == "put":
+                    data[name] = record
+                else:
+                    data.pop(name, None)
+                entries += 1
+            fh.truncate(offset)
+        return entries
+
+    def compact(self, data, background=True):
+        self.wait()
+        snapshot = dict(data)
+        self.close_log()
+        if os.path.exists(self.log_file):
+            if os.path.exists(self.rotated_file):
+                import shutil
+
+                with open(self.log_file, "rb") as src, open(
+                    self.rotated_file, "ab"
+                ) as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.log_file)
+            else:
+                os.replace(self.log_file, self.rotated_file)
+        self.entries = 0
+        self.compaction = threading.Thread(target=self.write_snapshot, args=(snapshot,))
+        self.compaction.start()
+        if not background:
+            self.wait()
+
+    def write_snapshot(self, snapshot):
+        tmp = self.file + ".tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump(snapshot, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.file)
+        if os.path.exists(self.rotated_file):
+            os.remove(self.rotated_file)
+
+    def wait(self):
+        if self.compaction is not None:
+            self.compaction.join()
+            self.compaction = None
+
+    def close_log(self):
+        if self.log is not None:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            self.log.close()
+            self.log = None
+
+    def dump(self, data):
+        if not isinstance(data, JournalRecords) or data.store is not self:
+            self.compact(data, background=False)
+            return
+        self.close_log()
+        self.wait()
+
+    def save_changes(self, data, changes):
+        if not isinstance(data, JournalRecords) or data.store is not self:
+            self.dump(data)
+        elif self.log is not None:
+            self.log.flush()
+            os.fsync(self.log.fileno())
+
+    def load(self) -> JournalRecords:
+        self.wait()
+        data = {}
+        if os.path.exists(self.file):
+            try:
+                with open(self.file, "rb") as fh:
+                    data = pickle.load(fh)
+            except:
+                data = {}
+        self.entries = self.replay(self.rotated_file, data)
+        self.entries += self.replay(self.log_file, data)
+        return JournalRecords(data, self)
+
+
+class SQLitePhoneIndex(Index):
+    def __init__(self, records):
+        self.records = records
+
+    def lookup(self, phone) -> list[Record]:
+        rows = self.records.conn.execute(
+            "SELECT r.name FROM phones p JOIN records r ON r.id = p.record_id"
+            " WHERE p.phone = ? GROUP BY r.id ORDER BY r.id",
+            (getattr(phone, "value", phone),),
+        )
+        return [self.records[name] for (name,) in rows]
+
+
+class SQLiteInsertionOrder(Index):
+    def __init__(self, records):
+        self.records = records
+
+    def _rows(self, query, *args):
+        return [tuple(row) for row in self.records.conn.execute(query, args)]
+
+    def after(self, key, n):
+        return self._rows(
+            "SELECT id, name FROM records WHERE id > ? ORDER BY id LIMIT ?",
+            -1 if key is None else key,
+            n,
+        )
+
+    def before(self, key, n):
+        return self._rows(
+            "SELECT id, name FROM records WHERE id < ? ORDER BY id DESC LIMIT ?", key, n
+        )[::-1]
+
+    def at(self, position, n):
+        return self._rows(
+            "SELECT id, name FROM records ORDER BY id LIMIT ? OFFSET ?", n, position
+        )
+
+    def sort(self, records):
+        names = [record.name.value for record in records]
+        rows = self.records.conn.execute(
+            f"SELECT name, id FROM records WHERE name IN ({', '.join('?' * len(names))})",
+            names,
+        )
+        seq = dict(rows)
+        return sorted(records, key=lambda record: seq[record.name.value])
+
+
+class SQLiteNameRange:
+    def __init__(self, records, start=None, end=None, resolve=None):
+        self.records = records
+        self.start = start
+        self.end = end
+        self.resolve = resolve
+
+    def _rows(self, condition, args, order, n, offset=0):
+        conditions = [condition] if condition else []
+        if self.start is not None:
+            conditions.append("name >= ?")
+            args += (self.start,)
+        if self.end is not None:
+            conditions.append("name < ?")
+            args += (self.end,)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.records.conn.execute(
+            f"SELECT name FROM records {where} ORDER BY name {order} LIMIT ? OFFSET ?",
+            args + (n, offset),
+        )
+        return [(name, self.resolve(name)) for (name,) in rows]
+
+    def after(self, key, n):
+        if key is None:
+            return self._rows(None, (), "ASC", n)
+        return self._rows("name > ?", (key,), "ASC", n)
+
+    def before(self, key, n):
+        return self._rows("name < ?", (key,), "DESC", n)[::-1]
+
+    def at(self, position, n):
+        return self._rows(None, (), "ASC", n, position)
+
+    def __iter__(self):
+        return (record for (_, record) in self._rows(None, (), "ASC", -1))
+
+
+class SQLiteNameIndex(Index):
+    def __init__(self, records):
+        self.records = records
+
+    def range(self, start=None, end=None, resolve=None):
+        return SQLiteNameRange(self.records, start, end, resolve)
+
+
+class SQLiteTextIndex(Index):
+    def __init__(self, records):
+        self.records = records
+
+    def candidates(self, value: str):
+        rows = self.records.conn.execute(
+            "SELECT name FROM records WHERE instr(name, ?)"
+            " UNION SELECT r.name FROM phones p JOIN records r ON r.id = p.record_id"
+            " WHERE instr(p.phone, ?)",
+            (value, value),
+        )
+        return {name for (name,) in rows}
+
+
+class SQLiteBirthdayIndex(Index):
+    def __init__(self, records):
+        self.records = records
+
+    def between(self, start: tuple, end: tuple) -> list[str]:
+        rows = self.records.conn.execute(
+            "SELECT r.name FROM birthdays b JOIN records r ON r.id = b.record_id"
+            " WHERE (b.month, b.day) BETWEEN (?, ?) AND (?, ?)"
+            " ORDER BY b.month, b.day, r.name",
+            start + end,
+        )
+        return [name for (name,) in rows]
+
+
+class SQLiteRecords(MutableMapping):
+    indexes = {
+        PhoneIndex: SQLitePhoneIndex,
+        InsertionOrder: SQLiteInsertionOrder,
+        TrigramIndex: SQLiteTextIndex,
+        BirthdayIndex: SQLiteBirthdayIndex,
+        NameIndex: SQLiteNameIndex,
+    }
+
+    batch_size = 100
+    book = None
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def bind(self, book):
+        self.book = book
+
+    def make_index(self, cls):
+        index = self.indexes.get(cls)
+        return index(self) if index else None
+
+    def _id(self, name):
+        row = self.conn.execute(
+            "SELECT id FROM records WHERE name = ?", (getattr(name, "value", name),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def __getitem__(self, name) -> Record:
+        record_id = self._id(name)
+        record = Record(Name(getattr(name, "value", name)))
+        record.phones = [
+            Phone._from_value(phone)
+            for (phone,) in self.conn.execute(
+                "SELECT phone FROM phones WHERE record_id = ? ORDER BY position",
+                (record_id,),
+            )
+        ]
+        row = self.conn.execute(
+            "SELECT birthday FROM birthdays WHERE record_id = ?", (record_id,)
+        ).fetchone()
+        if row is not None:
+            record.birthday = Birthday(datetime.date.fromisoformat(row[0]))
+        record._book = self.book
+        return record
+
+    def __setitem__(self, name, record: Record):
+        name = getattr(name, "value", name)
+        self.conn.execute("INSERT OR IGNORE INTO records (name) VALUES (?)", (name,))
+        record_id = self._id(name)
+        self.conn.execute("DELETE FROM phones WHERE record_id = ?", (record_id,))
+        self.conn.executemany(
+            "INSERT INTO phones (record_id, position, phone) VALUES (?, ?, ?)",
+            [(record_id, i, phone.value) for i, phone in enumerate(record.phones)],
+        )
+        self.conn.execute("DELETE FROM birthdays WHERE record_id = ?", (record_id,))
+        if record.birthday is not None:
+            birthday = record.birthday.value
+            self.conn.execute(
+                "INSERT INTO birthdays (record_id, birthday, month, day) VALUES (?, ?, ?, ?)",
+                (record_id, birthday.isoformat(), birthday.month, birthday.day),
+            )
+
+    def __delitem__(self, name):
+        record_id = self._id(name)
+        self.conn.execute("DELETE FROM phones WHERE record_id = ?", (record_id,))
+        self.conn.execute("DELETE FROM birthdays WHERE record_id = ?", (record_id,))
+        self.conn.execute("DELETE FROM records WHERE id = ?", (record_id,))
+
+    def __contains__(self, name) -> bool:
+        return (
+            self.conn.execute(
+                "SELECT 1 FROM records WHERE name = ?", (getattr(name, "value", name),)
+            ).fetchone()
+            is not None
+        )
+
+    def __iter__(self):
+        last = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, name FROM records WHERE id > ? ORDER BY id LIMIT ?",
+                (last, self.batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for last, name in rows:
+                yield Name(name)
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT count(*) FROM records").fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}: {len(self)} records>"
+
+
+class SQLiteStore(Store):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS phones (
+            record_id INTEGER NOT NULL REFERENCES records (id),
+            position INTEGER NOT NULL,
+            phone TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+        CREATE INDEX IF NOT EXISTS phones_record ON phones (record_id, position);
+        CREATE TABLE IF NOT EXISTS birthdays (
+            record_id INTEGER PRIMARY KEY REFERENCES records (id),
+            birthday TEXT NOT NULL,
+            month INTEGER NOT NULL,
+            day INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS birthdays_month_day ON birthdays (month, day);
+    """
+
+    CORRUPTION = ("file is not a database", "malformed")
+
+    def __init__(self, file, timeout=5.0):
+        self.file = file
+        self.timeout = timeout
+        self.conn = None
+
+    def connect(self):
+        if self.conn is None:
+            import sqlite3
+
+            conn = sqlite3.connect(self.file, self.timeout, check_same_thread=False)
+            try:
+                conn.executescript(self.SCHEMA)
+            except sqlite3.DatabaseError as e:
+                conn.close()
+                corrupt = not isinstance(e, sqlite3.OperationalError) and any(
+                    signal in str(e) for signal in self.CORRUPTION
+                )
+                if not corrupt:
+                    raise
+                os.remove(self.file)
+                conn = sqlite3.connect(self.file, self.timeout, check_same_thread=False)
+                conn.executescript(self.SCHEMA)
+            self.conn = conn
+        return self.conn
+
+    def dump(self, data):
+        conn = self.connect()
+        if not isinstance(data, SQLiteRecords) or data.conn is not conn:
+            records = SQLiteRecords(conn)
+            for name in list(records):
+                del records[name]
+            for name, record in data.items():
+                records[name] = record
+        conn.commit()
+
+    def save_changes(self, data, changes):
+        conn = self.connect()
+        if not isinstance(data, SQLiteRecords) or data.conn is not conn:
+            records = SQLiteRecords(conn)
+            try:
+                for name in changes:
+                    if name in data:
+                        records[name] = data[name]
+                    elif name in records:
+                        del records[name]
+            except:
+                conn.rollback()
+                raise
+        conn.commit()
+
+    def load(self) -> SQLiteRecords:
+        return SQLiteRecords(self.connect())
+
+
+class SnapshotRecords(MutableMapping):
+    HEADER = struct.Struct("<8sQQQQ")
+    ENTRY = struct.Struct("<QIIIi")
+    PHONE = struct.Struct("<QI")
+    MAGIC = b"CBSNAP1\0"
+    book = None
+
+    def __init__(self, mm):
+        self.mm = mm
+        if len(mm) < self.HEADER.size:
+            raise ValueError("Truncated address book snapshot")
+        header = self.HEADER.unpack_from(mm)
+        magic, self.count, self.table, self.phones, self.arena = header
+        if magic != self.MAGIC:
+            raise ValueError("Not an address book snapshot")
+        if (
+            self.table != self.HEADER.size
+            or self.phones != self.table + self.count * self.ENTRY.size
+            or self.arena < self.phones
+            or (self.arena - self.phones) % self.PHONE.size
+            or self.arena > len(mm)
+            or self._arena_end() > len(mm) - self.arena
+        ):
+            raise ValueError("Truncated address book snapshot")
+        self.overlay = {}
+        self.added = set()
+        self.deleted = set()
+
+    def _arena_end(self):
+        if not self.count:
+            return 0
+        name_offset, name_length, phone_start, phone_count, _ = self._entry(
+            self.count - 1
+        )
+        end = name_offset + name_length
+        if phone_count:
+            last = self.phones + (phone_start + phone_count - 1) * self.PHONE.size
+            if last + self.PHONE.size > self.arena:
+                raise ValueError("Truncated address book snapshot")
+            offset, length = self.PHONE.unpack_from(self.mm, last)
+            end = max(end, offset + length)
+        return end
+
+    def _entry(self, i):
+        return self.ENTRY.unpack_from(self.mm, self.table + i * self.ENTRY.size)
+
+    def _text(self, offset, length):
+        start = self.arena + offset
+        return self.mm[start : start + length]
+
+    def _name(self, i) -> bytes:
+        name_offset, name_length, _, _, _ = self._entry(i)
+        return self._text(name_offset, name_length)
+
+    def _find(self, key: str):
+        target = key.encode()
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._name(lo) == target:
+            return lo
+        return None
+
+    def _decode(self, i) -> Record:
+        name_offset, name_length, phone_start, phone_count, birthday = self._entry(i)
+        record = Record(Name._from_value(self._text(name_offset, name_length).decode()))
+        phones = []
+        for j in range(phone_start, phone_start + phone_count):
+            offset, length = self.PHONE.unpack_from(
+                self.mm, self.phones + j * self.PHONE.size
+            )
+            phones.append(Phone._from_value(self._text(offset, length).decode()))
+        record.phones = phones
+        if birthday:
+            record.birthday = Birthday._from_value(datetime.date.fromordinal(birthday))
+        record._book = self.book
+        return record
+
+    def bind(self, book):
+        self.book = book
+
+    def __getitem__(self, name) -> Record:
+        key = getattr(name, "value", name)
+        if key in self.overlay:
+            return self.overlay[key]
+        if key not in self.deleted:
+            i = self._find(key)
+            if i is not None:
+                return self._decode(i)
+        raise KeyError(name)
+
+    def __setitem__(self, name, record: Record):
+        key = getattr(name, "value", name)
+        self.deleted.discard(key)
+        if key not in self.overlay and self._find(key) is None:
+            self.added.add(key)
+        self.overlay[key] = record
+
+    def __delitem__(self, name):
+        key = getattr(name, "value", name)
+        if key not in self:
+            raise KeyError(name)
+        self.overlay.pop(key, None)
+        if key in self.added:
+            self.added.remove(key)
+        else:
+            self.deleted.add(key)
+
+    def __contains__(self, name) -> bool:
+        key = getattr(name, "value", name)
+        if key in self.overlay:
+            return True
+        return key not in self.deleted and self._find(key) is not None
+
+    def __len__(self) -> int:
+        return self.count - len(self.deleted) + len(self.added)
+
+    def values(self):
+        for i in range(self.count):
+            key = self._name(i).decode()
+            if key in self.overlay:
+                yield self.overlay[key]
+            elif key not in self.deleted:
+                yield self._decode(i)
+        for key in list(self.overlay):
+            if key in self.added:
+                yield self.overlay[key]
+
+    def __iter__(self):
+        return (record.name for record in self.values())
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}: {len(self)} records>"
+
+    def close(self):
+        self.mm.close()
+
+
+class MmapStore(Store):
+    def __init__(self, file):
+        self.file = file
+
+    def dump(self, data):
+        layout = SnapshotRecords
+        records = sorted(data.values(), key=lambda record: record.name.value.encode())
+        table = bytearray()
+        phones = bytearray()
+        arena = bytearray()
+        phone_count = 0
+        for record in records:
+            name = record.name.value.encode()
+            name_offset = len(arena)
+            arena += name
+            for phone in record.phones:
+                value = phone.value.encode()
+                phones += layout.PHONE.pack(len(arena), len(value))
+                arena += value
+            birthday = record.birthday.value.toordinal() if record.birthday else 0
+            table += layout.ENTRY.pack(
+                name_offset, len(name), phone_count, len(record.phones), birthday
+            )
+            phone_count += len(record.phones)
+        table_offset = layout.HEADER.size
+        phones_offset = table_offset + len(table)
+        arena_offset = phones_offset + len(phones)
+        tmp = self.file + ".tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(
+                layout.HEADER.pack(
+                    layout.MAGIC,
+                    len(records),
+                    table_offset,
+                    phones_offset,
+                    arena_offset,
+                )
+            )
+            fh.write(table)
+            fh.write(phones)
+            fh.write(arena)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.file)
+
+    def load(self):
+        import mmap
+
+        if not os.path.exists(self.file):
+            return {}
+        with open(self.file, "rb") as fh:
+            if fh.read(len(SnapshotRecords.MAGIC)) != SnapshotRecords.MAGIC:
+                raise ValueError(f"{self.file} is not an address book snapshot")
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return SnapshotRecords(mm)
+        except ValueError:
+            mm.close()
+            os.remove(self.file)
+            return {}
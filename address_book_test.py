@@ -1,6 +1,10 @@
 import address_book
 import datetime
+import io
+import os
+import pickle
 import pytest
+import threading
 
 
 def test_record():
@@ -21,6 +25,28 @@ def test_record():
     assert str(record_1) == "Alex: Phones: 380501015455"
 
 
+def test_phone_canonical(monkeypatch):
+    phone = address_book.Phone(" +38 (050) 101-54-55 ")
+    assert phone.value == "380501015455"
+    assert phone.packed == 1380501015455
+    assert phone == "380-50-101-54-55"
+    assert phone != "0501015455"
+    assert len({phone, address_book.Phone("380501015455")}) == 1
+    with pytest.raises(address_book.ValidationError) as e:
+        address_book.Phone("050 CALL NOW")
+    assert e.value.message == "Phone should contain digits only, got 050CALLNOW"
+
+    monkeypatch.setattr(address_book.Phone, "default_country", "380")
+    assert address_book.Phone("050 101 54 55") == phone
+    assert address_book.Phone("00380501015455") == phone
+    book = address_book.AddressBook()
+    book.add_record(address_book.Record(address_book.Name("Alex"), phone))
+    assert [str(r.name) for r in book.search_record_by_phone("050-101-54-55").iter] == [
+        "Alex"
+    ]
+    assert book.search_record_by_phone("not a phone").iter == []
+
+
 def test_double_add():
     name_1 = address_book.Name("Alex")
     phone_1 = address_book.Phone("+380501015455")
@@ -124,3 +150,794 @@ def test_search_by_phone():
     contact_book.add_record(record)
 
     assert len(list(contact_book.search_record_by_phone("098764537291"))[0]) == 2
+
+
+def test_search_by_phone_index_follows_mutations():
+    contact_book = address_book.AddressBook()
+    jane = address_book.Record(
+        address_book.Name("Jane"), address_book.Phone("098764537291")
+    )
+    contact_book.add_record(jane)
+    contact_book.add_record(
+        address_book.Record(
+            address_book.Name("John"), address_book.Phone("123456789091")
+        )
+    )
+    assert list(contact_book.search_record_by_phone("123456789091"))[0] == [
+        contact_book["John"]
+    ]
+
+    contact_book.get_record("Jane").add_phone(address_book.Phone("123456789091"))
+    assert [
+        str(r.name)
+        for r in list(contact_book.search_record_by_phone("123456789091"))[0]
+    ] == ["Jane", "John"]
+
+    contact_book.get_record("Jane").change_phone(
+        None, address_book.Phone("555555555555")
+    )
+    assert list(contact_book.search_record_by_phone("098764537291")) == []
+    assert len(list(contact_book.search_record_by_phone("555555555555"))[0]) == 1
+
+    contact_book.get_record("Jane").delete_phone(address_book.Phone("123456789091"))
+    contact_book.delete_record(address_book.Name("John"))
+    assert list(contact_book.search_record_by_phone("123456789091")) == []
+
+
+def test_search_uses_trigram_index():
+    contact_book = address_book.AddressBook()
+    for name, phone in [("Alex", "123456789091"), ("Alexandra", "098764537291")]:
+        contact_book.add_record(
+            address_book.Record(address_book.Name(name), address_book.Phone(phone))
+        )
+    assert [str(r.name) for r in list(contact_book.search("Alex"))[0]] == [
+        "Alex",
+        "Alexandra",
+    ]
+    assert [str(r.name) for r in list(contact_book.search("xand"))[0]] == ["Alexandra"]
+    assert list(contact_book.search("Bob")) == []
+
+    contact_book.get_record("Alex").add_phone(address_book.Phone("555000111222"))
+    assert [str(r.name) for r in list(contact_book.search("5000"))[0]] == ["Alex"]
+    contact_book.delete_record(address_book.Name("Alex"))
+    assert list(contact_book.search("5000")) == []
+    assert len(list(contact_book.search("le"))[0]) == 1
+
+
+def test_journal_store(tmp_path):
+    store = address_book.JournalStore(str(tmp_path / "contacts.bin"))
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    book.add_record(
+        address_book.Record(
+            address_book.Name("Alex"), address_book.Phone("123456789091")
+        )
+    )
+    book.add_record(address_book.Record(address_book.Name("Jane")))
+    book.get_record("Alex").add_phone(address_book.Phone("098764537291"))
+    book.delete_record(address_book.Name("Jane"))
+    book.save_to_file(store)
+    assert not (tmp_path / "contacts.bin").exists()
+
+    with open(tmp_path / "contacts.bin.log", "ab") as fh:
+        fh.write(b"\x80\x04torn")
+
+    book_2 = address_book.AddressBook()
+    book_2.read_from_file(address_book.JournalStore(str(tmp_path / "contacts.bin")))
+    assert list(book_2.data) == ["Alex"]
+    assert str(book_2["Alex"]) == "Alex: Phones: 123456789091, 098764537291"
+
+
+def test_journal_store_compaction(tmp_path):
+    store = address_book.JournalStore(str(tmp_path / "contacts.bin"), compact_every=3)
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    for i in range(10):
+        book.add_record(address_book.Record(address_book.Name("name %d" % i)))
+    book.save_to_file(store)
+    assert (tmp_path / "contacts.bin").exists()
+    assert not (tmp_path / "contacts.bin.log.1").exists()
+
+    book_2 = address_book.AddressBook()
+    book_2.read_from_file(address_book.JournalStore(str(tmp_path / "contacts.bin")))
+    assert len(book_2) == 10
+
+
+def test_sqlite_store(tmp_path):
+    store = address_book.SQLiteStore(str(tmp_path / "contacts.db"))
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    book.add_record(
+        address_book.Record(
+            address_book.Name("Alex"),
+            address_book.Phone("123456789091"),
+            address_book.Birthday("01/03/2014"),
+        )
+    )
+    book.add_record(
+        address_book.Record(
+            address_book.Name("Jane"), address_book.Phone("098764537291")
+        )
+    )
+    book.get_record("Jane").add_phone(address_book.Phone("123456789091"))
+    book.save_to_file(store)
+
+    book_2 = address_book.AddressBook()
+    book_2.read_from_file(address_book.SQLiteStore(str(tmp_path / "contacts.db")))
+    assert len(book_2) == 2
+    assert str(book_2.get_record("Alex")) == (
+        "Alex: Phones: 123456789091, Birthday: 01/03/2014"
+    )
+    assert [
+        str(r.name) for r in list(book_2.search_record_by_phone("123456789091"))[0]
+    ] == ["Alex", "Jane"]
+    assert [str(r.name) for r in list(book_2.search("8764"))[0]] == ["Jane"]
+    assert [str(r) for r in list(book_2)[0]] == [
+        "Alex: Phones: 123456789091, Birthday: 01/03/2014",
+        "Jane: Phones: 098764537291, 123456789091",
+    ]
+    upcoming = book_2.upcoming_birthdays(1, today=datetime.date(2023, 2, 28))
+    assert [str(r.name) for page in upcoming for r in page] == ["Alex"]
+    book_2.delete_record(address_book.Name("Alex"))
+    with pytest.raises(KeyError):
+        book_2.get_record("Alex")
+
+
+@pytest.mark.freeze_time
+def test_days_to_birthday_leap_day(freezer):
+    record = address_book.Record(
+        address_book.Name("Alex"), birthday=address_book.Birthday("29/02/2000")
+    )
+    freezer.move_to("2023-02-27")
+    assert record.days_to_birthday() == 2
+    freezer.move_to("2024-02-27")
+    assert record.days_to_birthday() == 2
+
+
+def test_upcoming_birthdays():
+    book = address_book.AddressBook()
+    for name, birthday in [
+        ("Alex", "29/02/2000"),
+        ("Jane", "01/03/1990"),
+        ("John", "31/12/1981"),
+        ("Mary", "02/01/2003"),
+        ("Ann", "15/06/1970"),
+    ]:
+        book.add_record(
+            address_book.Record(
+                address_book.Name(name), birthday=address_book.Birthday(birthday)
+            )
+        )
+
+    def upcoming(days, today):
+        view = book.upcoming_birthdays(days, today=datetime.date.fromisoformat(today))
+        return [str(r.name) for page in view for r in page]
+
+    assert upcoming(0, "2023-03-01") == ["Alex", "Jane"]
+    assert upcoming(1, "2024-02-28") == ["Alex"]
+    assert upcoming(5, "2023-12-30") == ["John", "Mary"]
+    assert upcoming(10, "2023-06-01") == []
+    assert upcoming(365, "2023-06-01") == ["Ann", "John", "Mary", "Alex", "Jane"]
+
+    book.get_record("Ann").delete_birthday()
+    book.get_record("Mary").set_birthday(address_book.Birthday("10/06/2003"))
+    assert upcoming(14, "2023-06-01") == ["Mary"]
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_birthday_columns(monkeypatch, vectorized):
+    if vectorized:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(address_book, "import_numpy", lambda: None)
+    book = address_book.AddressBook()
+    for name, birthday in [
+        ("Alex", "29/02/2000"),
+        ("Jane", "01/03/1990"),
+        ("John", "31/12/1981"),
+        ("Mary", "02/01/2003"),
+    ]:
+        book.add_record(
+            address_book.Record(
+                address_book.Name(name), birthday=address_book.Birthday(birthday)
+            )
+        )
+    book.add_record(address_book.Record(address_book.Name("Ann")))
+
+    assert book.days_to_birthday_all(datetime.date(2023, 2, 28)) == {
+        "Alex": 1,
+        "Jane": 1,
+        "John": 306,
+        "Mary": 308,
+    }
+    assert book.days_to_birthday_all(datetime.date(2024, 2, 28)) == {
+        "Alex": 1,
+        "Jane": 2,
+        "John": 307,
+        "Mary": 309,
+    }
+    assert book.days_to_birthday_all(datetime.date(2023, 12, 31)) == {
+        "Alex": 60,
+        "Jane": 61,
+        "John": 0,
+        "Mary": 2,
+    }
+    assert book.birthday_histogram() == [1, 1, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+
+    book.delete_record(address_book.Name("Alex"))
+    book.get_record("Ann").set_birthday(address_book.Birthday("15/06/1970"))
+    book.get_record("John").delete_birthday()
+    assert book.days_to_birthday_all(datetime.date(2023, 6, 1)) == {
+        "Mary": 215,
+        "Jane": 274,
+        "Ann": 14,
+    }
+    assert book.birthday_histogram() == [1, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0]
+
+
+def test_query_cache():
+    book = address_book.AddressBook(cache_size=2)
+    book.add_record(
+        address_book.Record(address_book.Name("John"), address_book.Phone("1234567899"))
+    )
+
+    def names(view):
+        return [str(record.name) for record in view.iter]
+
+    assert names(book.search("Jo")) == ["John"]
+    assert names(book.search("Jo")) == ["John"]
+    phone = address_book.Phone("1234567899")
+    assert names(book.search_record_by_phone(phone)) == ["John"]
+    assert names(book.search_record_by_phone("1234567899")) == ["John"]
+    assert book.cache_info() == address_book.CacheInfo(2, 2, 2, 2)
+
+    book.add_record(
+        address_book.Record(address_book.Name("Joan"), address_book.Phone("1234567898"))
+    )
+    assert names(book.search("Jo")) == ["John", "Joan"]
+    book.get_record("Joan").change_phone(None, address_book.Phone("1234567899"))
+    assert names(book.search_record_by_phone("1234567899")) == ["John", "Joan"]
+    book.delete_record(address_book.Name("John"))
+    assert names(book.search("Jo")) == ["Joan"]
+    assert names(book.search("Jo")) == ["Joan"]
+    assert book.cache_info() == address_book.CacheInfo(3, 5, 2, 2)
+
+    book.search("an")
+    book.search("Joa")
+    assert names(book.search("Jo")) == ["Joan"]
+    assert book.cache_info().misses == 8
+
+
+# AddressBook.data pickled by the original PickleStore, whose Phone only
+# stripped "+", "(", ")", "-" and spaces.
+BASELINE_PICKLE = (
+    b"\x80\x04\x95\xf5\x00\x00\x00\x00\x00\x00\x00}\x94(\x8c\x0caddress_book"
+    b"\x94\x8c\x04Name\x94\x93\x94)\x81\x94}\x94\x8c\r_Field__value\x94\x8c\x04John"
+    b"\x94sbh\x01\x8c\x06Record\x94\x93\x94)\x81\x94}\x94(\x8c\x04name\x94h\x04"
+    b"\x8c\x06phones\x94]\x94(h\x01\x8c\x05Phone\x94\x93\x94)\x81\x94}\x94h\x06"
+    b"\x8c\x0f380.50.101.5455\x94sbh\x10)\x81\x94}\x94h\x06\x8c\x0c38050ABC4567"
+    b"\x94sbe\x8c\x08birthday\x94Nubh\x03)\x81\x94}\x94h\x06\x8c\x04Jane\x94sbh\t)"
+    b"\x81\x94}\x94(h\x0ch\x18h\r]\x94h\x10)\x81\x94}\x94h\x06\x8c\x0c380501234567"
+    b"\x94sbah\x17Nubu."
+)
+
+
+def test_baseline_pickle(tmp_path):
+    (tmp_path / "contacts.bin").write_bytes(BASELINE_PICKLE)
+    book = address_book.AddressBook()
+    book.read_from_file(address_book.PickleStore(str(tmp_path / "contacts.bin")))
+    john = book.get_record("John")
+    assert str(john) == "John: Phones: 380501015455, 38050ABC4567"
+    assert john.phones[1] == "38050ABC4567"
+
+    def names(phone):
+        return [
+            str(r.name) for page in book.search_record_by_phone(phone) for r in page
+        ]
+
+    assert names("380501015455") == ["John"]
+    assert names("380501234567") == ["Jane"]
+    john.delete_phone(address_book.Phone("380501015455"))
+    assert str(book.get_record("John")) == "John: Phones: 38050ABC4567"
+
+
+def test_dirty(tmp_path):
+    store = address_book.PickleStore(str(tmp_path / "contacts.bin"))
+    book = address_book.AddressBook()
+    assert not book.dirty
+    book.add_record(address_book.Record(address_book.Name("John")))
+    assert book.dirty
+    book.save_to_file(store)
+    assert not book.dirty
+    book.get_record("John").add_phone(address_book.Phone("1234567899"))
+    assert book.dirty
+
+    book.read_from_file(store)
+    assert not book.dirty
+    with pytest.raises(ValueError):
+        book.get_record("John").delete_phone(address_book.Phone("0987654321"))
+    assert not book.dirty
+    book.delete_record(address_book.Name("John"))
+    assert book.dirty
+
+
+@pytest.mark.parametrize(
+    "store_class",
+    [address_book.PickleStore, address_book.SQLiteStore, address_book.MmapStore],
+)
+def test_loaded_records_track_changes(tmp_path, store_class):
+    store = store_class(str(tmp_path / "contacts"))
+    book = address_book.AddressBook()
+    book.add_record(address_book.Record(address_book.Name("John")))
+    book.save_to_file(store)
+
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    record = list(book.search("John").iter)[0]
+    record.add_phone(address_book.Phone("1234567899"))
+    assert book.dirty
+    found = list(book.search_record_by_phone("1234567899").iter)
+    assert [str(r.name) for r in found] == ["John"]
+    book.save_to_file(store)
+
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    assert str(book.get_record("John")) == "John: Phones: 1234567899"
+
+
+class RecordingStore(address_book.Store):
+    def __init__(self):
+        self.saved = []
+        self.failing = False
+
+    def dump(self, data):
+        self.save_changes(data, None)
+
+    def save_changes(self, data, changes):
+        if self.failing:
+            raise OSError("disk full")
+        self.saved.append(changes)
+
+
+def test_save_changes():
+    store = RecordingStore()
+    book = address_book.AddressBook()
+    book.add_record(address_book.Record(address_book.Name("John")))
+    book.add_record(address_book.Record(address_book.Name("Jane")))
+    book.get_record("John").set_birthday(address_book.Birthday("01/01/1990"))
+    assert book.changes == {"John", "Jane"}
+
+    book.save_changes(store)
+    assert store.saved == [{"John", "Jane"}]
+    assert not book.dirty
+
+    book.delete_record(address_book.Name("Jane"))
+    store.failing = True
+    with pytest.raises(OSError):
+        book.save_changes(store)
+    assert book.changes == {"Jane"}
+    store.failing = False
+    book.save_to_file(store)
+    assert store.saved[-1] is None
+    assert not book.dirty
+
+
+def test_autosave():
+    store = RecordingStore()
+    book = address_book.ConcurrentAddressBook()
+    autosave = address_book.AutoSave(book, store, interval=60, every=3).start()
+    for name in ["John", "Jane"]:
+        book.add_record(address_book.Record(address_book.Name(name)))
+    book.get_record("John").add_phone(address_book.Phone("1234567899"))
+    for _ in range(500):
+        if store.saved:
+            break
+        threading.Event().wait(0.01)
+    assert store.saved == [{"John", "Jane"}]
+
+    book.delete_record(address_book.Name("Jane"))
+    autosave.stop()
+    assert book.autosave is None
+    assert store.saved == [{"John", "Jane"}, {"Jane"}]
+
+
+def test_journal_save_changes(tmp_path):
+    store = address_book.JournalStore(str(tmp_path / "contacts.bin"))
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    book.add_record(address_book.Record(address_book.Name("John")))
+    book.save_changes(store)
+    assert not os.path.exists(tmp_path / "contacts.bin")
+
+    reopened = address_book.AddressBook()
+    reopened.read_from_file(address_book.JournalStore(str(tmp_path / "contacts.bin")))
+    assert [str(name) for name in reopened.data] == ["John"]
+    store.close_log()
+
+
+def test_sqlite_save_changes(tmp_path):
+    store = address_book.SQLiteStore(str(tmp_path / "contacts.db"))
+    book = address_book.AddressBook()
+    for name in ["John", "Jane", "Joan"]:
+        book.add_record(address_book.Record(address_book.Name(name)))
+    book.save_to_file(store)
+
+    book.get_record("John").add_phone(address_book.Phone("1234567899"))
+    book.delete_record(address_book.Name("Jane"))
+    store.conn.execute("UPDATE records SET name = 'Joanna' WHERE name = 'Joan'")
+    book.save_changes(store)
+
+    saved = store.load()
+    assert sorted(str(name) for name in saved) == ["Joanna", "John"]
+    assert str(saved["John"]) == "John: Phones: 1234567899"
+
+
+def test_compact_record():
+    book = address_book.AddressBook(compact=True)
+    record = book.record_class(
+        address_book.Name("Alex"), address_book.Phone("+380501015455")
+    )
+    book.add_record(record)
+    record.add_phone(address_book.Phone("098764537291"))
+    assert isinstance(record, address_book.CompactRecord)
+    assert str(record) == "Alex: Phones: 380501015455, 098764537291"
+    assert record.phones == [
+        address_book.Phone("380501015455"),
+        address_book.Phone("098764537291"),
+    ]
+    assert len(list(book.search_record_by_phone("098764537291"))[0]) == 1
+    assert not hasattr(record, "__dict__")
+    assert not hasattr(record.name, "__dict__")
+    with pytest.raises(address_book.ValidationError):
+        record.add_phone(address_book.Phone("phone-number"))
+
+    restored = pickle.loads(pickle.dumps(record))
+    assert str(restored) == str(record)
+    assert hash(restored.name) == hash("Alex")
+
+
+def test_bulk_add():
+    book = address_book.AddressBook()
+    book.add_record(address_book.Record(address_book.Name("Jane")))
+    rows = [
+        ("Alex", ["123456789091", "098764537291"], "01/03/2014"),
+        ("Bob", ["12345"], ""),
+        ("Jane", [], ""),
+        ("Carl", [], "31/02/2000"),
+        ("Alex", ["555555555555"], ""),
+        ("Dan", ["555555555555"], None),
+    ]
+    added, errors = book.bulk_add(rows, batch_size=2)
+    assert added == 2
+    assert [(row, type(e)) for row, e in errors] == [
+        (2, address_book.ValidationError),
+        (3, ValueError),
+        (4, address_book.ValidationError),
+        (5, ValueError),
+    ]
+    assert str(book["Alex"]) == (
+        "Alex: Phones: 123456789091, 098764537291, Birthday: 01/03/2014"
+    )
+    assert len(list(book.search_record_by_phone("555555555555"))[0]) == 1
+
+
+def test_read_csv_and_vcard():
+    csv_rows = list(
+        address_book.read_csv(
+            io.StringIO(
+                "name,phones,birthday\nAlex,123456789091;098764537291,01/03/2014\nBob\n"
+            )
+        )
+    )
+    assert csv_rows == [
+        ("Alex", ["123456789091", "098764537291"], "01/03/2014"),
+        ("Bob", [], ""),
+    ]
+    vcard = (
+        "BEGIN:VCARD\r\nVERSION:3.0\r\nN:Smith;John;;;\r\nTEL;TYPE=cell:+38 (050) 101\r\n"
+        " 5455\r\nBDAY:1981-09-13\r\nEND:VCARD\r\n"
+        "BEGIN:VCARD\r\nFN:Jane Doe\r\nTEL:1234567890\r\nEND:VCARD\r\n"
+    )
+    assert list(address_book.read_vcard(io.StringIO(vcard))) == [
+        ("John Smith", ["+38 (050) 1015455"], datetime.date(1981, 9, 13)),
+        ("Jane Doe", ["1234567890"], None),
+    ]
+
+
+def test_export():
+    book = address_book.AddressBook()
+    book.add_record(
+        address_book.Record(
+            address_book.Name("Alex"),
+            address_book.Phone("123456789091"),
+            address_book.Birthday("01/03/2014"),
+        )
+    )
+    book.get_record("Alex").add_phone(address_book.Phone("098764537291"))
+    book.add_record(address_book.Record(address_book.Name("Jane, Doe")))
+
+    stream = io.StringIO()
+    assert book.export(stream, "csv") == 2
+    assert stream.getvalue() == (
+        "name,phones,birthday\r\n"
+        "Alex,123456789091;098764537291,01/03/2014\r\n"
+        '"Jane, Doe",,\r\n'
+    )
+    stream.seek(0)
+    imported = address_book.AddressBook()
+    assert imported.bulk_add(address_book.read_csv(stream)) == (2, [])
+
+    stream = io.StringIO()
+    assert book.export(stream, "jsonl") == 2
+    assert stream.getvalue().splitlines() == [
+        '{"name": "Alex", "phones": ["123456789091", "098764537291"], "birthday": "01/03/2014"}',
+        '{"name": "Jane, Doe", "phones": [], "birthday": null}',
+    ]
+    with pytest.raises(ValueError):
+        book.export(io.StringIO(), "xml")
+
+
+def test_read_write_lock_reentrancy():
+    lock = address_book.ReadWriteLock()
+    with lock.writing():
+        with lock.writing(), lock.reading():
+            assert lock.writer is not None
+    with lock.reading(), lock.reading():
+        assert lock.readers == 1
+        with pytest.raises(RuntimeError):
+            with lock.writing():
+                pass
+    assert lock.readers == 0 and lock.writer is None
+
+
+def test_concurrent_address_book():
+    book = address_book.ConcurrentAddressBook()
+    for i in range(200):
+        book.add_record(
+            address_book.Record(
+                address_book.Name("name %d" % i), address_book.Phone("1234567890")
+            )
+        )
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            name = address_book.Name("extra %d" % i)
+            book.add_record(address_book.Record(name, address_book.Phone("1234567890")))
+            book.get_record("name 0").add_phone(address_book.Phone("5555555555"))
+            book.get_record("name 0").delete_phone(address_book.Phone("5555555555"))
+            book.delete_record(name)
+            i += 1
+
+    def reader():
+        try:
+            for _ in range(50):
+                for view in (
+                    book,
+                    book.search("name"),
+                    book.search("na"),
+                    book.search_record_by_phone("1234567890"),
+                ):
+                    assert sum(len(page) for page in list(view)) >= 200
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [
+        threading.Thread(target=reader) for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads[1:]:
+        thread.join()
+    stop.set()
+    threads[0].join()
+    assert errors == []
+    assert len(book) == 200
+    assert len(list(book.search_record_by_phone("5555555555"))) == 0
+
+
+def test_mmap_store(tmp_path):
+    store = address_book.MmapStore(str(tmp_path / "contacts.snap"))
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    for name, phone in [
+        ("John", "1234567899"),
+        ("Alex", "098764537291"),
+        ("Яна", "5555555555"),
+    ]:
+        book.add_record(
+            address_book.Record(address_book.Name(name), address_book.Phone(phone))
+        )
+    book.get_record("Alex").set_birthday(address_book.Birthday("29/02/2000"))
+    book.save_to_file(store)
+
+    book_2 = address_book.AddressBook()
+    book_2.read_from_file(store)
+    assert isinstance(book_2.data, address_book.SnapshotRecords)
+    assert len(book_2) == 3
+    assert str(book_2.get_record("Alex")) == (
+        "Alex: Phones: 098764537291, Birthday: 29/02/2000"
+    )
+    assert "Bob" not in book_2
+
+    book_2.get_record("John").add_phone(address_book.Phone("1111111111"))
+    book_2.delete_record(address_book.Name("Alex"))
+    book_2.add_record(address_book.Record(address_book.Name("Bob")))
+    assert str(book_2.get_record("John")) == "John: Phones: 1234567899, 1111111111"
+    assert [str(r.name) for r in list(book_2)[0]] == ["John", "Яна", "Bob"]
+    assert len(list(book_2.search_record_by_phone("1111111111"))[0]) == 1
+    book_2.save_to_file(store)
+
+    book_3 = address_book.AddressBook()
+    book_3.read_from_file(store)
+    assert [str(r) for r in list(book_3)[0]] == [
+        "Bob: Phones: ",
+        "John: Phones: 1234567899, 1111111111",
+        "Яна: Phones: 5555555555",
+    ]
+
+    snapshot = (tmp_path / "contacts.snap").read_bytes()
+    (tmp_path / "contacts.snap").write_bytes(snapshot[:-3])
+    book_4 = address_book.AddressBook()
+    book_4.read_from_file(store)
+    assert len(book_4) == 0
+    assert not os.path.exists(tmp_path / "contacts.snap")
+
+    address_book.PickleStore(str(tmp_path / "contacts.snap")).dump(book_3.data)
+    with pytest.raises(ValueError):
+        book_4.read_from_file(store)
+    pickled = address_book.PickleStore(str(tmp_path / "contacts.snap")).load()
+    assert sorted(str(name) for name in pickled) == ["Bob", "John", "Яна"]
+
+
+def test_cursor_pagination():
+    book = address_book.AddressBook()
+    for i in range(12):
+        book.add_record(address_book.Record(address_book.Name("name %d" % i)))
+
+    def names(page):
+        return [str(record.name) for record in page]
+
+    pages = book.pages(4)
+    assert names(next(pages)) == ["name 0", "name 1", "name 2", "name 3"]
+    book.delete_record(address_book.Name("name 4"))
+    book.add_record(address_book.Record(address_book.Name("name 12")))
+    assert names(next(pages)) == ["name 5", "name 6", "name 7", "name 8"]
+    assert names(pages.prev()) == ["name 0", "name 1", "name 2", "name 3"]
+    with pytest.raises(StopIteration):
+        pages.prev()
+    assert names(pages.page(3)) == ["name 9", "name 10", "name 11", "name 12"]
+    with pytest.raises(StopIteration):
+        next(pages)
+    with pytest.raises(StopIteration):
+        pages.page(4)
+
+    view = address_book.AddressBookView(iter(range(7))).pages(3)
+    assert next(view) == [0, 1, 2]
+    with pytest.raises(StopIteration):
+        view.page(4)
+    assert view.page(3) == [6]
+    assert view.prev() == [3, 4, 5]
+    assert next(view) == [6]
+
+
+def test_sqlite_store_locked_or_corrupt(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "contacts.db")
+    store = address_book.SQLiteStore(path)
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    book.add_record(address_book.Record(address_book.Name("Alex")))
+    book.save_to_file(store)
+
+    store.conn.execute("BEGIN EXCLUSIVE")
+    with pytest.raises(sqlite3.OperationalError):
+        address_book.SQLiteStore(path, timeout=0).connect()
+    store.conn.rollback()
+    book.read_from_file(address_book.SQLiteStore(path))
+    assert [str(name) for name in book.data] == ["Alex"]
+
+    corrupt = str(tmp_path / "corrupt.db")
+    with open(corrupt, "wb") as f:
+        f.write(b"not a database" * 100)
+    book.read_from_file(address_book.SQLiteStore(corrupt))
+    assert len(book) == 0
+
+
+def test_sqlite_cursor_pagination(tmp_path):
+    store = address_book.SQLiteStore(str(tmp_path / "contacts.db"))
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    for i in range(7):
+        book.add_record(address_book.Record(address_book.Name("name %d" % i)))
+    book.delete_record(address_book.Name("name 1"))
+    pages = book.pages(3)
+    assert [str(r.name) for r in pages.page(2)] == ["name 4", "name 5", "name 6"]
+    assert [str(r.name) for r in pages.prev()] == ["name 0", "name 2", "name 3"]
+
+
+def test_name_index_queries(tmp_path):
+    def names(view):
+        return [str(record.name) for page in view for record in page]
+
+    for store in (None, address_book.SQLiteStore(str(tmp_path / "contacts.db"))):
+        book = address_book.AddressBook()
+        if store:
+            book.read_from_file(store)
+        for name in ["John", "Alex", "Joanna", "Bob", "Jo", "Zed", "Jp"]:
+            book.add_record(address_book.Record(address_book.Name(name)))
+        assert names(book.starts_with("Jo")) == ["Jo", "Joanna", "John"]
+        assert names(book.starts_with("")) == [
+            "Alex",
+            "Bob",
+            "Jo",
+            "Joanna",
+            "John",
+            "Jp",
+            "Zed",
+        ]
+        assert names(book.names_between("B", "Jp")) == ["Bob", "Jo", "Joanna", "John"]
+        book.delete_record(address_book.Name("Joanna"))
+        book.add_record(address_book.Record(address_book.Name("Joe")))
+        pages = book.starts_with("Jo").pages(2)
+        assert [str(r.name) for r in pages.page(2)] == ["John"]
+        assert [str(r.name) for r in pages.prev()] == ["Jo", "Joe"]
+        assert names(book.starts_with("X")) == []
+
+
+def test_fuzzy_find():
+    assert address_book.edit_distance("john", "jonh", 2) == 1
+    assert address_book.edit_distance("john", "jane", 2) == 3
+    assert address_book.edit_distance("alexandra", "alexander", 2) == 2
+
+    book = address_book.AddressBook()
+    for name in ["John", "Jon", "Joan", "Alexandra Smith", "Bob"]:
+        book.add_record(address_book.Record(address_book.Name(name)))
+    assert [str(r.name) for r in book.find("jonh").iter] == ["John", "Jon", "Joan"]
+    assert [str(r.name) for r in book.find("Alexandr Smith").iter] == [
+        "Alexandra Smith"
+    ]
+    assert book.suggest("Jhn", limit=2) == ["John", "Jon"]
+
+    book.delete_record(address_book.Name("John"))
+    book.add_record(address_book.Record(address_book.Name("Rob")))
+    assert book.suggest("Jhn") == ["Jon", "Joan"]
+    assert book.suggest("Bbo") == ["Bob", "Rob"]
+    assert book.find("Zzzz").iter == []
+
+    book = address_book.AddressBook()
+    book.bulk_add((f"Alex Brown {i}", [], None) for i in range(2000))
+    book.add_record(address_book.Record(address_book.Name("John Smith")))
+    assert book.suggest("Aelx Brown 1234", limit=1) == ["Alex Brown 1234"]
+    assert book.suggest("alex brown 1999", limit=1) == ["Alex Brown 1999"]
+    assert book.suggest("Jon") == ["John Smith"]
+    assert book.suggest("Smith") == ["John Smith"]
+    assert book.suggest("Smiht Jonh") == ["John Smith"]
+    assert len(book.find("Alex").iter) == address_book.FuzzyIndex.max_candidates
+
+
+def test_fuzzy_background_build(monkeypatch):
+    monkeypatch.setattr(address_book.FuzzyIndex, "background_size", 1)
+    started = threading.Event()
+    run = address_book.FuzzyBuild.run
+
+    def blocked(build, names):
+        started.wait()
+        run(build, names)
+
+    monkeypatch.setattr(address_book.FuzzyBuild, "run", blocked)
+    book = address_book.AddressBook()
+    for name in ["John", "Joan", "Bob"]:
+        book.add_record(address_book.Record(address_book.Name(name)))
+    assert book.suggest("Jhn") == []
+    build = book._fuzzy_build
+    book.add_record(address_book.Record(address_book.Name("Jon")))
+    book.delete_record(address_book.Name("John"))
+    assert book.suggest("Jhn") == []
+    started.set()
+    build.thread.join()
+    assert book.suggest("Jhn") == ["Jon", "Joan"]
+    assert book._fuzzy_build is None
@@ -0,0 +1,103 @@
+import argparse
+import timeit
+from inspect import signature, Parameter
+
+import address_book
+import bot
+
+
+def legacy_input_error(func):
+    argument_names = [
+        v.name
+        for v in signature(func).parameters.values()
+        if v.default == Parameter.empty
+    ][1:]
+    argument_types = [p.annotation for p in signature(func).parameters.values()][1:]
+    desc = ", ".join(argument_names)
+
+    def wrapper(bot, *args):
+        try:
+            if len(args) < len(argument_names):
+                return f"Not enough data for this command, please provide: {desc}"
+            if len(args) > len(argument_types):
+                return f"Too much data for this command, please provide: {desc} (you provided {args})"
+            args = [t(a) for (t, a) in zip(argument_types, args)]
+            return func(bot, *args)
+        except KeyError as e:
+            return f"{e} doesn't exist"
+        except ValueError as e:
+            return f"{e}"
+        except address_book.ValidationError as e:
+            return f"Please enter valid {e.field}: {e.message}"
+
+    return wrapper
+
+
+def legacy_command_parser(cmdline, handlers):
+    command = ""
+    args = []
+    for cmd in sorted(handlers.keys(), key=lambda s: len(s), reverse=True):
+        if cmdline.startswith(cmd):
+            command = cmd
+            cmdline = cmdline[len(cmd) :].strip()
+            break
+    if cmdline:
+        args = map(str.strip, cmdline.split(","))
+    return command, args
+
+
+COMMANDS = [
+    "hello",
+    "show all",
+    "phone John",
+    "days to birthday John",
+    "search Jo",
+    "add phone Nobody, 1234567890",
+]
+
+
+def make_bot():
+    session = bot.Bot()
+    session.contact_book.add_record(
+        address_book.Record(
+            address_book.Name("John"),
+            address_book.Phone("1234567899"),
+            address_book.Birthday("13/09/1981"),
+        )
+    )
+    return session
+
+
+def measure(cmdline, parse, handlers, number):
+    session = make_bot()
+
+    def dispatch():
+        command, args = parse(cmdline)
+        handlers[command](session, *args)
+
+    return min(timeit.repeat(dispatch, number=number, repeat=5)) / number * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-command dispatch overhead")
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    options = parser.parse_args()
+
+    legacy = {
+        command: legacy_input_error(handler.__wrapped__)
+        for command, handler in bot.Handler.items()
+    }
+    print(f"{'command':<32}{'before, ns':>12}{'after, ns':>12}{'speedup':>10}")
+    for cmdline in COMMANDS:
+        before = measure(
+            cmdline,
+            lambda s: legacy_command_parser(s, legacy),
+            legacy,
+            options.number,
+        )
+        after = measure(cmdline, bot.command_parser, bot.Handler, options.number)
+        print(f"{cmdline:<32}{before:>12.0f}{after:>12.0f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
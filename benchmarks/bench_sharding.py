@@ -0,0 +1,83 @@
+import argparse
+import os
+import tempfile
+import time
+
+import address_book
+import sharding
+
+
+def rows(size):
+    for i in range(size):
+        yield (
+            "Person %07d" % i,
+            ["380%09d" % i],
+            "%02d/%02d/1990" % (i % 28 + 1, i % 12 + 1),
+        )
+
+
+def workloads(size, repeat):
+    # Every query is distinct so neither the in-process nor the per-shard
+    # QueryCache can answer it.
+    letters = "jqwxz"
+    return {
+        # Shorter than a trigram: a full Record.match scan that matches nothing.
+        "scan": [letters[i % 5] + letters[i // 5 % 5] for i in range(repeat)],
+        # Digit runs found through the trigram index: a few dozen records each.
+        "point": ["%07d" % (i * 7919 % size) for i in range(repeat)],
+        # Name prefixes matching ~1000 records each, so results are pickled
+        # and sent back through the shard pipes.
+        "broad": ["Person %04d" % (i % max(1, size // 1000)) for i in range(repeat)],
+    }
+
+
+def time_searches(book, queries):
+    found = 0
+    start = time.perf_counter()
+    for query in queries:
+        found += len(list(book.search(query).iter))
+    return (time.perf_counter() - start) / len(queries), found / len(queries)
+
+
+def report(label, book, queries, single=None):
+    timings = {}
+    for name, workload in queries.items():
+        elapsed, found = time_searches(book, workload)
+        timings[name] = elapsed
+        line = f"{label} {name}: {elapsed * 1000:.2f} ms/search, {found:.0f} results"
+        if single is not None:
+            line += f", speedup {single[name] / elapsed:.2f}x"
+        print(line)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Scatter/gather search speedup per shard count"
+    )
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-shards", type=int, default=os.cpu_count() or 1)
+    options = parser.parse_args()
+
+    queries = workloads(options.size, options.repeat)
+
+    book = address_book.AddressBook()
+    book.bulk_add(rows(options.size))
+    report("in-process", book, queries)
+
+    counts = sorted(
+        {1, 2, 4, 8, options.max_shards} & set(range(1, options.max_shards + 1))
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        single = None
+        for shards in counts:
+            path = os.path.join(directory, f"bench{shards}")
+            with sharding.ShardedAddressBook(path, shards=shards) as book:
+                book.bulk_add(rows(options.size))
+                timings = report(f"{shards} shard(s)", book, queries, single)
+            single = single or timings
+
+
+if __name__ == "__main__":
+    main()
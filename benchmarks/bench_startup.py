@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import address_book
+from benchmarks.bench_suite import make_book
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import bot
+inputs = iter(json.loads(sys.argv[1]))
+first = None
+
+def output(line):
+    global first
+    if first is None:
+        first = time.perf_counter() - start
+
+bot.main(read_string=lambda: next(inputs, "."), print=output, lazy=sys.argv[2] == "lazy")
+print(json.dumps({"first_output": first, "total": time.perf_counter() - start}))
+"""
+
+
+def run(directory, inputs, mode, env):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, json.dumps(inputs), mode],
+        cwd=directory,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = json.loads(result.stdout.splitlines()[-1])
+    timings["process"] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time to first response and session cost"
+    )
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        book = make_book(options.size)
+        name = next(iter(book.data.values())).name.value
+        address_book.PickleStore(os.path.join(directory, "contacts.bin")).dump(
+            book.data
+        )
+        env = dict(os.environ, PYTHONPATH=ROOT, PYTHONPYCACHEPREFIX=directory)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+        scenarios = [
+            ("hello, good bye", ["hello", "good bye"]),
+            (f"phone {name}", [f"phone {name}", "good bye"]),
+            ("add, good bye", ["add Startup Bench, 0991234567", "good bye"]),
+        ]
+        run(directory, ["good bye"], "eager", env)
+        print(f"{options.size} contacts, median of {options.repeat} runs")
+        print(
+            f"{'session':<28}{'mode':>6}{'first output, ms':>18}{'main, ms':>10}{'process, ms':>13}"
+        )
+        for label, inputs in scenarios:
+            for mode in ("eager", "lazy"):
+                runs = [
+                    run(directory, inputs, mode, env) for _ in range(options.repeat)
+                ]
+                first, total, process = (
+                    statistics.median(r[key] for r in runs) * 1000
+                    for key in ("first_output", "total", "process")
+                )
+                print(
+                    f"{label:<28}{mode:>6}{first:>18.1f}{total:>10.1f}{process:>13.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
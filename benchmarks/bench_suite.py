@@ -0,0 +1,263 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import address_book
+import bot
+
+FIRST_NAMES = ["John", "Mary", "Alex", "Jane", "Olena", "Taras", "Anna", "Ivan"]
+LAST_NAMES = ["Smith", "Shevchenko", "Brown", "Kovalenko", "Taylor", "Bondar"]
+
+
+def synthetic_rows(size, seed=0):
+    rng = random.Random(seed)
+    for i in range(size):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+        phones = ["380%09d" % i]
+        if i % 3 == 0:
+            phones.append("380%09d" % (size + i))
+        birthday = None
+        if i % 2 == 0:
+            born = datetime.date(1950, 1, 1) + datetime.timedelta(rng.randrange(20000))
+            birthday = born.strftime("%d/%m/%Y")
+        yield name, phones, birthday
+
+
+def make_book(size, seed=0):
+    book = address_book.AddressBook()
+    book.bulk_add(synthetic_rows(size, seed))
+    return book
+
+
+def percentile(latencies, q):
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def measure(name, size, func, number, setup=None):
+    latencies = []
+    for i in range(number):
+        args = setup(i) if setup else ()
+        start = time.perf_counter_ns()
+        func(*args)
+        latencies.append(time.perf_counter_ns() - start)
+    latencies.sort()
+    total = sum(latencies)
+
+    args = setup(number) if setup else ()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "operation": name,
+        "size": size,
+        "number": number,
+        "ops_per_sec": number / total * 1e9 if total else None,
+        "latency_us": {
+            "mean": total / number / 1000,
+            "p50": percentile(latencies, 0.5) / 1000,
+            "p90": percentile(latencies, 0.9) / 1000,
+            "p99": percentile(latencies, 0.99) / 1000,
+            "max": latencies[-1] / 1000,
+        },
+        "peak_memory_bytes": peak,
+    }
+
+
+def session_inputs(name):
+    return [
+        "hello",
+        "add Bench User, 0991234567, 01/01/1990",
+        f"phone {name}",
+        "search Shev",
+        "search phone 380000000001",
+        "days to birthday Bench User",
+        "show all",
+        "next",
+        "birthdays 7",
+        "remove Bench User",
+        "good bye",
+    ]
+
+
+def run_session(inputs):
+    lines = iter(inputs)
+    output = []
+    bot.main(read_string=lambda: next(lines, "."), print=output.append)
+    return output
+
+
+def bench_size(size, number, heavy_number, seed):
+    book = make_book(size, seed)
+    names = [record.name for record in book.data.values()]
+    phones = [record.phones[0] for record in book.data.values()]
+    born = [record for record in book.data.values() if record.birthday]
+    session = session_inputs(names[0])
+    rng = random.Random(seed)
+    results = []
+    book._cache.maxsize = 0
+
+    extra = iter(synthetic_rows(size + number + 1, seed + 1))
+    for _ in range(size):
+        next(extra)
+
+    def add_setup(i):
+        name, record_phones, birthday = next(extra)
+        record = address_book.Record(address_book.Name(f"Extra {name}"))
+        record.phones = [address_book.Phone(phone) for phone in record_phones]
+        return (record,)
+
+    results.append(measure("add_record", size, book.add_record, number, add_setup))
+    results.append(
+        measure(
+            "search_record_by_phone",
+            size,
+            lambda phone: list(book.search_record_by_phone(phone).iter),
+            number,
+            lambda i: (phones[rng.randrange(len(phones))],),
+        )
+    )
+    results.append(
+        measure(
+            "search",
+            size,
+            lambda query: list(book.search(query).iter),
+            number,
+            lambda i: (str(rng.randrange(size)).zfill(6),),
+        )
+    )
+    results.append(
+        measure(
+            "search_scan",
+            size,
+            lambda query: list(book.search(query).iter),
+            heavy_number,
+            lambda i: ("zq",),
+        )
+    )
+    results.append(
+        measure(
+            "days_to_birthday",
+            size,
+            lambda record: record.days_to_birthday(),
+            number,
+            lambda i: (born[rng.randrange(len(born))],),
+        )
+    )
+    results.append(
+        measure("days_to_birthday_all", size, book.days_to_birthday_all, heavy_number)
+    )
+    results.append(
+        measure(
+            "command_parser",
+            size,
+            bot.command_parser,
+            number,
+            lambda i: (session[i % len(session)],),
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = address_book.PickleStore(os.path.join(directory, "bench.bin"))
+        dump = lambda i: (book.data,)
+        results.append(
+            measure("PickleStore.dump", size, store.dump, heavy_number, dump)
+        )
+        results.append(measure("PickleStore.load", size, store.load, heavy_number))
+
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            address_book.PickleStore("contacts.bin").dump(book.data)
+            inputs = lambda i: (session,)
+            results.append(
+                measure("bot.main session", size, run_session, heavy_number, inputs)
+            )
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    before = {(r["operation"], r["size"]): r for r in baseline["results"]}
+    print(
+        f"{'operation':<28}{'size':>10}{'before p50, us':>16}"
+        f"{'after p50, us':>16}{'change':>10}"
+    )
+    for result in report["results"]:
+        old = before.get((result["operation"], result["size"]))
+        if old is None:
+            continue
+        after = result["latency_us"]["p50"]
+        previous = old["latency_us"]["p50"]
+        change = (after - previous) / previous * 100 if previous else 0
+        print(
+            f"{result['operation']:<28}{result['size']:>10}"
+            f"{previous:>16.1f}{after:>16.1f}{change:>+9.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="AddressBook and bot throughput at scale"
+    )
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("-n", "--number", type=int, default=1000)
+    parser.add_argument(
+        "--heavy-number", type=int, default=5, help="iterations of full-book operations"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "-o", "--output", help="write the JSON report here instead of stdout"
+    )
+    parser.add_argument(
+        "--compare", help="print p50 changes against an earlier JSON report"
+    )
+    options = parser.parse_args()
+
+    report = {
+        "revision": revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "numpy": address_book.import_numpy() is not None,
+        "results": [],
+    }
+    for size in map(int, options.sizes.split(",")):
+        report["results"] += bench_size(
+            size, options.number, options.heavy_number, options.seed
+        )
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if options.compare:
+        with open(options.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,186 @@
-from inspect import signature, Parameter
+from functools import wraps
+import os
+import threading
+import time
 import address_book
+import metrics
 
-Handler = {}
+
+class CommandRegistry(dict):
+    def __init__(self):
+        super().__init__()
+        self.trie = {}
+
+    def __setitem__(self, command, handler):
+        super().__setitem__(command, handler)
+        node = self.trie
+        for char in command:
+            node = node.setdefault(char, {})
+        node[None] = command
+
+    def __delitem__(self, command):
+        super().__delitem__(command)
+        path = [self.trie]
+        for char in command:
+            path.append(path[-1][char])
+        del path[-1][None]
+        for i in range(len(command), 0, -1):
+            if path[i]:
+                break
+            del path[i - 1][command[i - 1]]
+
+    def longest_prefix(self, cmdline):
+        command = ""
+        node = self.trie
+        for char in cmdline:
+            node = node.get(char)
+            if node is None:
+                break
+            command = node.get(None, command)
+        return command
+
+
+Handler = CommandRegistry()
 
 
 class Bot:
-    def __init__(self):
-        self.contact_book = address_book.AddressBook()
+    def __init__(self, contact_book=None):
+        if contact_book is None:
+            contact_book = address_book.AddressBook()
+        self._contact_book = contact_book
+        self._loading = None
         self.result_iterator = None
+        self.page_size = 5
+
+    @property
+    def contact_book(self) -> address_book.AddressBook:
+        if self._loading is not None:
+            thread, failure = self._loading
+            thread.join()
+            self._loading = None
+            if failure:
+                raise failure[0]
+        return self._contact_book
+
+    @contact_book.setter
+    def contact_book(self, contact_book):
+        self._contact_book = contact_book
+
+    @property
+    def loaded(self) -> bool:
+        return self._loading is None
+
+    def load_in_background(self, store):
+        failure = []
+
+        def load():
+            try:
+                self._contact_book.read_from_file(store)
+            except Exception as e:
+                failure.append(e)
+
+        thread = threading.Thread(target=load, daemon=True)
+        thread.start()
+        self._loading = (thread, failure)
+
+
+def number(name):
+    def convert(value):
+        try:
+            return int(value)
+        except ValueError:
+            message = f"Please enter valid {name}: {value} is not a number"
+            raise ValueError(message) from None
+
+    return convert
 
 
 def input_error(func):
-    argument_names = [
-        v.name
-        for v in signature(func).parameters.values()
-        if v.default == Parameter.empty
-    ][1:]
-    argument_types = [p.annotation for p in signature(func).parameters.values()][1:]
+    code = func.__code__
+    parameters = code.co_varnames[1 : code.co_argcount]
+    required = len(parameters) - len(func.__defaults__ or ())
+    argument_names = parameters[:required]
     desc = ", ".join(argument_names)
+    annotations = {p: func.__annotations__.get(p, str) for p in parameters}
+    converters = tuple(
+        None
+        if annotations[p] is str
+        else number(p.replace("_", " "))
+        if annotations[p] is int
+        else annotations[p]
+        for p in parameters
+    )
+
+    if not parameters:
+
+        def invoke(bot, args):
+            if args:
+                return f"Too much data for this command, please provide: {desc} (you provided {args})"
+            return func(bot)
 
-    def wrapper(bot, *args):
-        try:
-            if len(args) < len(argument_names):
+    elif not any(converters):
+
+        def invoke(bot, args):
+            if len(args) < required:
                 return f"Not enough data for this command, please provide: {desc}"
-            if len(args) > len(argument_types):
+            if len(args) > len(converters):
                 return f"Too much data for this command, please provide: {desc} (you provided {args})"
-            args = [t(a) for (t, a) in zip(argument_types, args)]
             return func(bot, *args)
+
+    else:
+
+        def invoke(bot, args):
+            if len(args) < required:
+                return f"Not enough data for this command, please provide: {desc}"
+            if len(args) > len(converters):
+                return f"Too much data for this command, please provide: {desc} (you provided {args})"
+            return func(bot, *[c(a) if c else a for (c, a) in zip(converters, args)])
+
+    name = func.__name__.rstrip("_").replace("_", " ")
+    operation = metrics.REGISTRY.operation("command", name)
+    observe = operation.latency.observe
+    perf_counter = time.perf_counter
+
+    @wraps(func)
+    def wrapper(bot, *args):
+        start = perf_counter()
+        try:
+            return invoke(bot, args)
         except KeyError as e:
-            return f"{e} doesn't exist"
+            operation.errors += 1
+            return missing(bot, e)
         except ValueError as e:
+            operation.errors += 1
             return f"{e}"
         except address_book.ValidationError as e:
+            operation.errors += 1
             return f"Please enter valid {e.field}: {e.message}"
+        finally:
+            observe(perf_counter() - start)
 
-    Handler[func.__name__.replace("_", " ")] = wrapper
+    Handler[name] = wrapper
     return wrapper
 
 
+def missing(bot, error):
+    message = f"{error} doesn't exist"
+    if error.args and isinstance(error.args[0], address_book.Name):
+        suggestions = bot.contact_book.suggest(error.args[0])
+        if suggestions:
+            message += f". Did you mean: {', '.join(suggestions)}?"
+    return message
+
+
 def read_string():
     string = input("Please enter your command: ")
     return string
 
 
 def command_parser(cmdline):
-    command = ""
     args = []
-    for cmd in sorted(Handler.keys(), key=lambda s: len(s), reverse=True):
-        if cmdline.startswith(cmd):
-            command = cmd
-            cmdline = cmdline[len(cmd) :].strip()
-            break
+    command = Handler.longest_prefix(cmdline)
+    if command:
+        cmdline = cmdline[len(command) :].strip()
     if cmdline:
         args = map(str.strip, cmdline.split(","))
     return command, args
@@ -68,7 +198,7 @@ def add(
     phone: address_book.Phone,
     birthday: address_book.Birthday = None,
 ):
-    bot.contact_book.add_record(address_book.Record(name, phone, birthday))
+    bot.contact_book.add_record(bot.contact_book.record_class(name, phone, birthday))
     return f"{name} is added to Contacts"
 
 
@@ -134,6 +264,63 @@ def days_to_birthday(bot: Bot, name: address_book.Name):
     return f"{bot.contact_book.get_record(name).days_to_birthday()} days"
 
 
+@input_error
+def birthdays(bot: Bot, days: int):
+    return bot.contact_book.upcoming_birthdays(days)
+
+
+@input_error
+def birthday_stats(bot: Bot):
+    import calendar
+
+    days = bot.contact_book.days_to_birthday_all()
+    if not days:
+        return "No birthdays in Contacts"
+    name = min(days, key=days.get)
+    months = ", ".join(
+        f"{calendar.month_abbr[month]}: {count}"
+        for month, count in enumerate(bot.contact_book.birthday_histogram(), start=1)
+    )
+    return f"{len(days)} birthdays, next is {name} in {days[name]} days\n{months}"
+
+
+@input_error
+def import_(bot: Bot, path: str, fmt: str = None):
+    if fmt is None:
+        fmt = "vcard" if path.lower().endswith((".vcf", ".vcard")) else "csv"
+    readers = {"csv": address_book.read_csv, "vcard": address_book.read_vcard}
+    if fmt not in readers:
+        return f"Unknown format {fmt}, please use one of: {', '.join(readers)}"
+    try:
+        with open(path, newline="", encoding="utf-8") as fh:
+            added, errors = bot.contact_book.bulk_add(readers[fmt](fh))
+    except OSError as e:
+        return f"Cannot read {path}: {e.strerror}"
+    output = [f"Imported {added} contacts, {len(errors)} errors"]
+    for row, e in errors[:10]:
+        if isinstance(e, address_book.ValidationError):
+            output.append(f"Row {row}: Please enter valid {e.field}: {e.message}")
+        else:
+            output.append(f"Row {row}: {e}")
+    if len(errors) > 10:
+        output.append(f"... and {len(errors) - 10} more")
+    return "\n".join(output)
+
+
+@input_error
+def export(bot: Bot, path: str, fmt: str = None):
+    if fmt is None:
+        fmt = "jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv"
+    if fmt not in ("csv", "jsonl"):
+        return f"Unknown format {fmt}, please use one of: csv, jsonl"
+    try:
+        with open(path, "w", newline="", encoding="utf-8", buffering=1 << 16) as fh:
+            exported = bot.contact_book.export(fh, fmt)
+    except OSError as e:
+        return f"Cannot write {path}: {e.strerror}"
+    return f"Exported {exported} contacts to {path}"
+
+
 @input_error
 def show_all(bot: Bot):
     if not bot.contact_book:
@@ -141,6 +328,26 @@ def show_all(bot: Bot):
     return bot.contact_book
 
 
+@input_error
+def show_all_sorted(bot: Bot):
+    if not bot.contact_book:
+        return "Contact book is empty"
+    return bot.contact_book.names_between()
+
+
+@input_error
+def find(bot: Bot, name: str):
+    view = bot.contact_book.find(name)
+    if not view.iter:
+        return f"No contacts similar to {name}"
+    return view
+
+
+@input_error
+def starts_with(bot: Bot, prefix: str):
+    return bot.contact_book.starts_with(prefix)
+
+
 @input_error
 def next(bot: Bot):
     if not bot.result_iterator:
@@ -154,44 +361,139 @@ def next(bot: Bot):
         return "No more data to scroll"
 
 
+@input_error
+def prev(bot: Bot):
+    if not bot.result_iterator:
+        return "No scrolling context"
+    try:
+        return "\n".join(f"{line}" for line in bot.result_iterator.prev())
+    except StopIteration:
+        return "No previous data to scroll"
+
+
+@input_error
+def page(bot: Bot, page_number: int):
+    if not bot.result_iterator:
+        return "No scrolling context"
+    try:
+        return "\n".join(f"{line}" for line in bot.result_iterator.page(page_number))
+    except StopIteration:
+        return f"There is no page {page_number}"
+
+
+@input_error
+def page_size(bot: Bot, size: int):
+    if size < 1:
+        raise ValueError(f"Please enter valid size: {size} is not a positive number")
+    bot.page_size = size
+    return f"Showing {size} results per page"
+
+
 @input_error
 def search(bot: Bot, input: str):
     return bot.contact_book.search(input)
 
 
+@input_error
+def stats(bot: Bot):
+    lines = metrics.summary(metrics.REGISTRY)
+    info = bot.contact_book.cache_info()
+    lines.append(
+        f"search cache: {info.hits} hits, {info.misses} misses,"
+        f" {info.currsize}/{info.maxsize} entries"
+    )
+    return "\n".join(lines)
+
+
 class UserSession:
-    def __init__(self, store):
-        self.bot = Bot()
+    def __init__(self, store, lazy=False, autosave=None, autosave_every=100):
+        self.bot = Bot(address_book.ConcurrentAddressBook() if autosave else None)
         self.store = store
+        self.lazy = lazy
+        self.autosave = None
+        if autosave:
+            self.autosave = address_book.AutoSave(
+                self.bot._contact_book, store, autosave, autosave_every
+            )
 
     def __enter__(self):
-        self.bot.contact_book.read_from_file(self.store)
+        if self.lazy:
+            self.bot.load_in_background(self.store)
+        else:
+            self.bot.contact_book.read_from_file(self.store)
+        if self.autosave is not None:
+            self.autosave.start()
         return self
 
     def __exit__(self, *args):
-        self.bot.contact_book.save_to_file(self.store)
-
-
-def main(read_string=read_string, print=print):
-    with UserSession(address_book.PickleStore("contacts.bin")) as session:
+        if self.autosave is not None:
+            self.autosave.stop()
+        if self.bot.loaded and self.bot.contact_book.dirty:
+            self.bot.contact_book.save_to_file(self.store)
+
+
+def execute(bot, user_input):
+    command, args = command_parser(user_input)
+    if user_input == ".":
+        return None, True
+    if user_input in ["good bye", "close", "exit"]:
+        return "Good bye!", True
+    if command not in Handler:
+        return "Please rephrase your command", False
+    result = Handler[command](bot, *args)
+    if type(result) is not str:
+        bot.result_iterator = result.pages(bot.page_size)
+        result = next.__wrapped__(bot)
+    return result, False
+
+
+def main(read_string=read_string, print=print, store=None, lazy=False, autosave=None):
+    if store is None:
+        store = address_book.PickleStore("contacts.bin")
+    with UserSession(store, lazy, autosave) as session:
         while True:
-            user_input = read_string()
-            command, args = command_parser(user_input)
-            if user_input == ".":
-                break
-            if user_input in ["good bye", "close", "exit"]:
-                print("Good bye!")
+            output, stop = execute(session.bot, read_string())
+            if output is not None:
+                print(output)
+            if stop:
                 break
-            if command not in Handler:
-                print("Please rephrase your command")
-                continue
-            result = Handler[command](session.bot, *args)
-            if type(result) is str:
-                print(result)
-            else:
-                session.bot.result_iterator = iter(result)
-                print(next(session.bot))
+    metrics.REGISTRY.export()
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Contacts bot")
+    parser.add_argument(
+        "--profile",
+        metavar="SCRIPT",
+        default=os.environ.get("CONTACTS_BOT_PROFILE"),
+        help="replay the commands in SCRIPT and write a profiling report",
+    )
+    parser.add_argument(
+        "--profile-output",
+        default="profile",
+        help="prefix for the .txt hot-spot report and the .collapsed stacks",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="load the contact book in the background and only wait for it when needed",
+    )
+    parser.add_argument(
+        "--autosave",
+        type=float,
+        metavar="SECONDS",
+        help="save changes in the background every SECONDS or every 100 changes",
+    )
+    options = parser.parse_args()
+    if "CONTACTS_BOT_METRICS" in os.environ:
+        metrics.REGISTRY.exporters.append(
+            metrics.PrometheusTextFile(os.environ["CONTACTS_BOT_METRICS"])
+        )
+    if options.profile:
+        import profiling
+
+        profiling.run(options.profile, options.profile_output)
+    else:
+        main(lazy=options.lazy, autosave=options.autosave)
@@ -1,7 +1,9 @@
 import bot
+import metrics
 import pytest
 import os
 import os.path
+import threading
 
 
 @pytest.fixture(autouse=True)
@@ -231,6 +233,46 @@ def test_save_load():
     ]
 
 
+def test_lazy_session():
+    output = []
+    bot.main(
+        read_string=simulate_inputs(["hello", "."]), print=output.append, lazy=True
+    )
+    assert not os.path.exists("contacts.bin")
+
+    bot.main(read_string=simulate_inputs(["add John, 867594568901", "."]), lazy=True)
+    modified = os.path.getmtime("contacts.bin")
+    bot.main(
+        read_string=simulate_inputs(["phone John", "good bye"]),
+        print=output.append,
+        lazy=True,
+    )
+    assert output == ["How can I help you?", "867594568901", "Good bye!"]
+    assert os.path.getmtime("contacts.bin") == modified
+
+
+def test_autosave_session():
+    import address_book
+
+    seen = []
+
+    def read_string():
+        if not seen:
+            seen.append(None)
+            return "add John, 867594568901"
+        for _ in range(500):
+            if os.path.exists("contacts.bin"):
+                break
+            threading.Event().wait(0.01)
+        reopened = address_book.AddressBook()
+        reopened.read_from_file(address_book.PickleStore("contacts.bin"))
+        seen.append([str(name) for name in reopened.data])
+        return "."
+
+    bot.main(read_string=read_string, autosave=0.01)
+    assert seen == [None, ["John"]]
+
+
 def test_save_load_invalid():
     with open("contacts.json", "w") as f:
         f.write("Invalid")
@@ -395,3 +437,198 @@ def test_search_by_phone():
         "John: Phones: 867594568901\nJane: Phones: 867594568901, 1234567890",
         "Jane: Phones: 867594568901, 1234567890",
     ]
+
+
+@pytest.mark.freeze_time
+def test_upcoming_birthdays(freezer):
+    freezer.move_to("2023-05-06")
+    output = []
+    inputs = [
+        "add John, 1234567899, 13/05/1981",
+        "add Mary, 1234567890, 07/05/2003",
+        "add Jane, 1234567891, 01/09/2000",
+        "birthdays 10",
+        "birthdays soon",
+        ".",
+    ]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    assert output[3:] == [
+        "Mary: Phones: 1234567890, Birthday: 07/05/2003\n"
+        "John: Phones: 1234567899, Birthday: 13/05/1981",
+        "Please enter valid days: soon is not a number",
+    ]
+
+
+@pytest.mark.freeze_time
+def test_birthday_stats(freezer):
+    freezer.move_to("2023-02-27")
+    output = []
+    inputs = [
+        "birthday stats",
+        "add John, 1234567899, 13/05/1981",
+        "add Mary, 1234567890, 29/02/2000",
+        "add Jane, 1234567891, 01/05/2000",
+        "birthday stats",
+        ".",
+    ]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    assert output[0] == "No birthdays in Contacts"
+    assert output[4] == (
+        "3 birthdays, next is Mary in 2 days\n"
+        "Jan: 0, Feb: 1, Mar: 0, Apr: 0, May: 2, Jun: 0, "
+        "Jul: 0, Aug: 0, Sep: 0, Oct: 0, Nov: 0, Dec: 0"
+    )
+
+
+def test_import(tmp_path):
+    path = tmp_path / "contacts.csv"
+    path.write_text("name,phones,birthday\nJohn,1234567899,13/09/1981\nJane,123\n")
+    output = []
+    inputs = [f"import {path}", "show all", f"import {tmp_path / 'missing.csv'}", "."]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    assert output == [
+        "Imported 1 contacts, 1 errors\n"
+        "Row 2: Please enter valid phone: Length of the phone should be greater than 10. Your phone has only 3 digits",
+        "John: Phones: 1234567899, Birthday: 13/09/1981",
+        f"Cannot read {tmp_path / 'missing.csv'}: No such file or directory",
+    ]
+
+
+def test_export(tmp_path):
+    path = tmp_path / "contacts.jsonl"
+    output = []
+    inputs = ["add John, 1234567899", f"export {path}", f"export {path}, xml", "."]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    assert output == [
+        "John is added to Contacts",
+        f"Exported 1 contacts to {path}",
+        "Unknown format xml, please use one of: csv, jsonl",
+    ]
+    assert path.read_text() == (
+        '{"name": "John", "phones": ["1234567899"], "birthday": null}\n'
+    )
+
+
+def test_command_parser():
+    command, args = bot.command_parser("add phone John, 1234567890")
+    assert (command, list(args)) == ("add phone", ["John", "1234567890"])
+    command, args = bot.command_parser("phones Jane")
+    assert (command, list(args)) == ("phones", ["Jane"])
+    command, args = bot.command_parser("ad John")
+    assert (command, list(args)) == ("", ["ad John"])
+
+
+def test_command_registry():
+    registry = bot.CommandRegistry()
+    registry["add"] = registry["add phone"] = registry["phone"] = None
+    assert registry.longest_prefix("add phone John") == "add phone"
+    del registry["add phone"]
+    assert registry.longest_prefix("add phone John") == "add"
+    assert registry.trie["a"]["d"]["d"] == {None: "add"}
+    del registry["add"]
+    assert list(registry.trie) == ["p"]
+
+
+def test_input_error_arity():
+    session = bot.Bot()
+    assert bot.Handler["hello"](session, "extra") == (
+        "Too much data for this command, please provide:  (you provided ('extra',))"
+    )
+    assert bot.Handler["search"](session) == (
+        "Not enough data for this command, please provide: input"
+    )
+    assert bot.Handler["birthdays"](session, "x") == (
+        "Please enter valid days: x is not a number"
+    )
+    assert bot.Handler["hello"].__wrapped__(session) == "How can I help you?"
+
+
+def test_page_commands():
+    output = []
+    inputs = ["add John %d, 1234567899" % i for i in range(7)] + [
+        "prev",
+        "page size 3",
+        "show all",
+        "page 3",
+        "prev",
+        "prev",
+        "prev",
+        "page 4",
+        "page x",
+        "page size 0",
+        "page size x",
+        ".",
+    ]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    assert output[7:] == [
+        "No scrolling context",
+        "Showing 3 results per page",
+        "John 0: Phones: 1234567899\nJohn 1: Phones: 1234567899\nJohn 2: Phones: 1234567899",
+        "John 6: Phones: 1234567899",
+        "John 3: Phones: 1234567899\nJohn 4: Phones: 1234567899\nJohn 5: Phones: 1234567899",
+        "John 0: Phones: 1234567899\nJohn 1: Phones: 1234567899\nJohn 2: Phones: 1234567899",
+        "No previous data to scroll",
+        "There is no page 4",
+        "Please enter valid page number: x is not a number",
+        "Please enter valid size: 0 is not a positive number",
+        "Please enter valid size: x is not a number",
+    ]
+
+
+def test_sorted_commands():
+    output = []
+    inputs = [
+        "add John, 1234567899",
+        "add Alex, 1234567898",
+        "add Joanna, 1234567897",
+        "show all sorted",
+        "starts with Jo",
+        "starts with Q",
+        ".",
+    ]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    assert output[3:] == [
+        "Alex: Phones: 1234567898\nJoanna: Phones: 1234567897\nJohn: Phones: 1234567899",
+        "Joanna: Phones: 1234567897\nJohn: Phones: 1234567899",
+        "No more data to scroll",
+    ]
+
+
+def test_fuzzy_suggestions():
+    output = []
+    inputs = [
+        "add John, 1234567899",
+        "add Joan, 1234567898",
+        "phone Jonh",
+        "find jon",
+        "find Mary",
+        ".",
+    ]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    assert output[2:] == [
+        "<Name: Jonh> doesn't exist. Did you mean: John, Joan?",
+        "Joan: Phones: 1234567898\nJohn: Phones: 1234567899",
+        "No contacts similar to Mary",
+    ]
+
+
+def test_stats():
+    metrics.REGISTRY.reset()
+    output = []
+    inputs = [
+        "add John, 1234567899",
+        "phone John",
+        "phone Jane",
+        "search Jo",
+        "search Jo",
+        "stats",
+        ".",
+    ]
+    bot.main(read_string=simulate_inputs(inputs), print=output.append)
+    lines = output[-1].split("\n")
+    assert lines[0].startswith("command phone: 2 calls, 1 errors, avg ")
+    assert lines[1].startswith("command search: 2 calls, 0 errors, avg ")
+    assert lines[2].startswith("command add: 1 calls, 0 errors, avg ")
+    assert lines[3].startswith("store PickleStore.load: 1 calls, 0 errors")
+    assert lines[-1] == "search cache: 1 hits, 1 misses, 1/128 entries"
+    assert metrics.REGISTRY.operation("store", "PickleStore.dump").calls == 1
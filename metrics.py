@@ -0,0 +1,165 @@
+from contextlib import contextmanager
+import bisect
+import os
+import time
+
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative(self):
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            yield bound, seen
+
+
+class Operation:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+
+    @property
+    def calls(self) -> int:
+        return self.latency.count
+
+    def reset(self):
+        self.latency.reset()
+        self.errors = 0
+
+
+class Metrics:
+    def __init__(self):
+        self.families = {"command": {}, "store": {}}
+        self.exporters = []
+
+    def operation(self, family: str, name: str) -> Operation:
+        operations = self.families[family]
+        operation = operations.get(name)
+        if operation is None:
+            operation = operations[name] = Operation()
+        return operation
+
+    @contextmanager
+    def timed(self, family: str, name: str):
+        operation = self.operation(family, name)
+        start = time.perf_counter()
+        try:
+            yield operation
+        except:
+            operation.errors += 1
+            raise
+        finally:
+            operation.latency.observe(time.perf_counter() - start)
+
+    def reset(self):
+        for operations in self.families.values():
+            for operation in operations.values():
+                operation.reset()
+
+    def export(self):
+        for exporter in self.exporters:
+            exporter.export(self)
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "inf"
+    return f"{seconds * 1000:g} ms"
+
+
+def summary(metrics: Metrics) -> list[str]:
+    lines = []
+    for family, operations in metrics.families.items():
+        used = [(name, op) for name, op in operations.items() if op.calls]
+        used.sort(key=lambda item: item[1].calls, reverse=True)
+        for name, op in used:
+            lines.append(
+                f"{family} {name}: {op.calls} calls, {op.errors} errors,"
+                f" avg {op.latency.sum / op.calls * 1000:.3f} ms,"
+                f" p50 <= {format_seconds(op.latency.quantile(0.5))},"
+                f" p99 <= {format_seconds(op.latency.quantile(0.99))}"
+            )
+    return lines
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus(metrics: Metrics, prefix="contacts_bot") -> str:
+    lines = []
+    for family, operations in metrics.families.items():
+        name = f"{prefix}_{family}"
+        lines.append(f"# HELP {name}_seconds Latency of {family} calls")
+        lines.append(f"# TYPE {name}_seconds histogram")
+        for label, op in operations.items():
+            if not op.calls:
+                continue
+            labels = f'{family}="{escape(label)}"'
+            for bound, count in op.latency.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{name}_seconds_sum{{{labels}}} {op.latency.sum!r}")
+            lines.append(f"{name}_seconds_count{{{labels}}} {op.calls}")
+        lines.append(f"# HELP {name}_errors_total Failed {family} calls")
+        lines.append(f"# TYPE {name}_errors_total counter")
+        for label, op in operations.items():
+            if op.calls:
+                labels = f'{family}="{escape(label)}"'
+                lines.append(f"{name}_errors_total{{{labels}}} {op.errors}")
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusTextFile:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, metrics: Metrics):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(prometheus(metrics))
+        os.replace(tmp, self.path)
+
+
+REGISTRY = Metrics()
@@ -0,0 +1,50 @@
+import pytest
+
+import metrics
+
+
+def test_histogram():
+    histogram = metrics.Histogram(buckets=(0.001, 0.01, 0.1))
+    for seconds in [0.0005, 0.001, 0.002, 0.05, 3]:
+        histogram.observe(seconds)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5
+    assert histogram.quantile(0.4) == 0.001
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(1) == float("inf")
+    assert list(histogram.cumulative()) == [
+        (0.001, 2),
+        (0.01, 3),
+        (0.1, 4),
+        (float("inf"), 5),
+    ]
+
+
+def test_timed_and_prometheus(tmp_path):
+    registry = metrics.Metrics()
+    with registry.timed("store", "PickleStore.load"):
+        pass
+    with pytest.raises(OSError):
+        with registry.timed("store", "PickleStore.load"):
+            raise OSError
+    registry.operation("command", "hello").latency.observe(0.0002)
+
+    path = tmp_path / "bot.prom"
+    registry.exporters.append(metrics.PrometheusTextFile(str(path)))
+    registry.export()
+    lines = path.read_text().splitlines()
+    assert 'contacts_bot_command_seconds_bucket{command="hello",le="0.0001"} 0' in lines
+    assert (
+        'contacts_bot_command_seconds_bucket{command="hello",le="0.00025"} 1' in lines
+    )
+    assert 'contacts_bot_command_seconds_count{command="hello"} 1' in lines
+    assert (
+        'contacts_bot_store_seconds_bucket{store="PickleStore.load",le="+Inf"} 2'
+        in lines
+    )
+    assert 'contacts_bot_store_errors_total{store="PickleStore.load"} 1' in lines
+    assert "# TYPE contacts_bot_store_seconds histogram" in lines
+
+    registry.reset()
+    assert registry.operation("store", "PickleStore.load").calls == 0
+    assert metrics.summary(registry) == []
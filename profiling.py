@@ -0,0 +1,120 @@
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+import cProfile
+import os.path
+import pstats
+import sys
+import threading
+import time
+
+import address_book
+import bot
+
+
+class SessionProfiler:
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.profiles = {}
+        self.totals = {}
+        self.stacks = Counter()
+        self.current = None
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+
+    def wrap(self, label, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            name = label(*args, **kwargs) if callable(label) else label
+            profile = self.profiles.get(name)
+            if profile is None:
+                profile = self.profiles[name] = cProfile.Profile()
+                self.totals[name] = [0, 0.0]
+            self.current = (name, sys._getframe())
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                total = self.totals[name]
+                total[0] += 1
+                total[1] += time.perf_counter() - start
+                self.current = None
+
+        return wrapper
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            current = self.current
+            frame = sys._current_frames().get(self.thread_id)
+            if current is None or frame is None:
+                continue
+            name, root = current
+            stack = []
+            while frame is not None and frame is not root:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frame is root:
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+
+    @contextmanager
+    def sampling(self):
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval))
+        sampler = threading.Thread(target=self.sample, daemon=True)
+        sampler.start()
+        try:
+            yield self
+        finally:
+            self.stopped.set()
+            sampler.join()
+            sys.setswitchinterval(switch_interval)
+
+    def report(self, stream, limit=15):
+        totals = sorted(self.totals.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (calls, seconds) in totals:
+            stream.write(f"{name}: {calls} calls, {seconds * 1000:.3f} ms total\n")
+        for name, _ in totals:
+            stream.write(f"\n=== {name} ===\n")
+            stats = pstats.Stats(self.profiles[name], stream=stream)
+            stats.strip_dirs().sort_stats("tottime").print_stats(limit)
+
+    def collapsed(self, stream):
+        for stack, count in sorted(self.stacks.items()):
+            stream.write(f"{stack} {count}\n")
+
+    def write(self, prefix, limit=15):
+        with open(f"{prefix}.txt", "w") as f:
+            self.report(f, limit)
+        with open(f"{prefix}.collapsed", "w") as f:
+            self.collapsed(f)
+
+
+def command_label(session, user_input):
+    command, _ = bot.command_parser(user_input)
+    return f"command {command or '(other)'}"
+
+
+def run(script, output="profile", store=None, interval=0.001, print=print):
+    with open(script) as f:
+        lines = iter([line.rstrip("\r\n") for line in f])
+    if store is None:
+        store = address_book.PickleStore("contacts.bin")
+    profiler = SessionProfiler(interval)
+    store.load = profiler.wrap("store load", store.load)
+    store.dump = profiler.wrap("store dump", store.dump)
+    execute = bot.execute
+    bot.execute = profiler.wrap(command_label, execute)
+    try:
+        with profiler.sampling():
+            bot.main(read_string=lambda: next(lines, "."), print=print, store=store)
+    finally:
+        bot.execute = execute
+    profiler.write(output)
+    return profiler
@@ -0,0 +1,51 @@
+import re
+
+import address_book
+import profiling
+
+
+def test_profile_replay(tmp_path):
+    script = tmp_path / "script.txt"
+    script.write_text("add John, 1234567899\nphone John\nsearch Jo\nnonsense\n")
+    store = address_book.PickleStore(str(tmp_path / "contacts.bin"))
+    output = []
+    profiler = profiling.run(
+        str(script), str(tmp_path / "profile"), store=store, print=output.append
+    )
+    assert output == [
+        "John is added to Contacts",
+        "1234567899",
+        "John: Phones: 1234567899",
+        "Please rephrase your command",
+    ]
+    assert {name: calls for name, (calls, _) in profiler.totals.items()} == {
+        "store load": 1,
+        "command add": 1,
+        "command phone": 1,
+        "command search": 1,
+        "command (other)": 2,
+        "store dump": 1,
+    }
+
+    report = (tmp_path / "profile.txt").read_text()
+    assert re.search(r"^command add: 1 calls, [\d.]+ ms total$", report, re.M)
+    assert "=== store dump ===" in report
+    for line in (tmp_path / "profile.collapsed").read_text().splitlines():
+        assert re.fullmatch(r"(command|store) [^;]+(;[^;]+)* \d+", line)
+
+
+def test_sampled_stacks():
+    profiler = profiling.SessionProfiler(interval=0.0005)
+
+    def busy():
+        end = profiling.time.perf_counter() + 0.05
+        while profiling.time.perf_counter() < end:
+            pass
+
+    with profiler.sampling():
+        profiler.wrap("command busy", busy)()
+    assert profiler.stacks
+    assert all(
+        stack.startswith("command busy;busy (profiling_test.py:")
+        for stack in profiler.stacks
+    )
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import os
+import re
+
+import address_book
+import bot
+import metrics
+
+BOOK_NAME = re.compile(r"[\w-]+")
+
+# import and export open arbitrary paths on the server host, so remote
+# sessions only get the commands that stay inside their address book.
+COMMANDS = (
+    "hello",
+    "add",
+    "add phone",
+    "change",
+    "phone",
+    "phones",
+    "remove",
+    "delete phone",
+    "set birthday",
+    "delete birthday",
+    "days to birthday",
+    "birthdays",
+    "birthday stats",
+    "show all",
+    "show all sorted",
+    "starts with",
+    "search",
+    "search phone",
+    "find",
+    "next",
+    "prev",
+    "page",
+    "page size",
+    "stats",
+)
+
+
+class SharedBook:
+    def __init__(self, store):
+        self.book = address_book.ConcurrentAddressBook()
+        self.store = store
+        self.sessions = 0
+        self.loading = asyncio.ensure_future(
+            asyncio.to_thread(self.book.read_from_file, store)
+        )
+
+
+class BookRegistry:
+    def __init__(self, store_factory):
+        self.store_factory = store_factory
+        self.books = {}
+        self.saving = {}
+
+    async def acquire(self, name) -> address_book.AddressBook:
+        if name not in self.books and name in self.saving:
+            await self.saving[name]
+        shared = self.books.get(name)
+        if shared is None:
+            shared = self.books[name] = SharedBook(self.store_factory(name))
+        shared.sessions += 1
+        try:
+            await shared.loading
+        except:
+            await self.release(name)
+            raise
+        return shared.book
+
+    async def release(self, name):
+        shared = self.books[name]
+        shared.sessions -= 1
+        if shared.sessions:
+            return
+        del self.books[name]
+        if shared.loading.exception() is not None or not shared.book.dirty:
+            return
+        saving = self.saving[name] = asyncio.ensure_future(
+            asyncio.to_thread(shared.book.save_to_file, shared.store)
+        )
+        try:
+            await saving
+        finally:
+            if self.saving.get(name) is saving:
+                del self.saving[name]
+
+
+def frame(output):
+    lines = [] if output is None else output.split("\n")
+    lines = ["." + line if line.startswith(".") else line for line in lines]
+    return "".join(line + "\n" for line in lines + ["."]).encode()
+
+
+class Server:
+    def __init__(self, directory=".", commands=COMMANDS):
+        self.registry = BookRegistry(
+            lambda name: address_book.PickleStore(
+                os.path.join(directory, f"{name}.bin")
+            )
+        )
+        self.commands = frozenset(commands)
+
+    def execute(self, session, user_input):
+        command, _ = bot.command_parser(user_input)
+        if command in bot.Handler and command not in self.commands:
+            return f"Command {command} is not available on this server", False
+        return bot.execute(session, user_input)
+
+    async def handle_client(self, reader, writer):
+        name = (await reader.readline()).decode().strip()
+        if not BOOK_NAME.fullmatch(name):
+            writer.write(frame("Please provide a valid address book name"))
+            writer.close()
+            return
+        session = bot.Bot(await self.registry.acquire(name))
+        try:
+            writer.write(frame(f"Connected to {name}"))
+            await writer.drain()
+            while line := await reader.readline():
+                output, stop = await asyncio.to_thread(
+                    self.execute, session, line.decode().rstrip("\r\n")
+                )
+                writer.write(frame(output))
+                await writer.drain()
+                if stop:
+                    break
+        finally:
+            writer.close()
+            await self.registry.release(name)
+
+    async def start_unix(self, path):
+        return await asyncio.start_unix_server(self.handle_client, path)
+
+    async def start_tcp(self, host, port):
+        return await asyncio.start_server(self.handle_client, host, port)
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, book, path=None, host=None, port=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer)
+        writer.write(f"{book}\n".encode())
+        await client.receive()
+        return client
+
+    async def receive(self):
+        lines = []
+        while (line := (await self.reader.readline()).decode().rstrip("\n")) != ".":
+            lines.append(line[1:] if line.startswith(".") else line)
+        return "\n".join(lines) if lines else None
+
+    async def send(self, user_input):
+        self.writer.write(f"{user_input}\n".encode())
+        await self.writer.drain()
+        return await self.receive()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def export_metrics(registry, interval):
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            registry.export()
+    finally:
+        registry.export()
+
+
+async def serve(options):
+    server = Server(options.directory)
+    if options.unix:
+        listener = await server.start_unix(options.unix)
+    else:
+        listener = await server.start_tcp(options.host, options.port)
+    exporting = None
+    if metrics.REGISTRY.exporters:
+        exporting = asyncio.ensure_future(
+            export_metrics(metrics.REGISTRY, options.metrics_interval)
+        )
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        if exporting is not None:
+            exporting.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve contact books over a line protocol"
+    )
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8023)
+    parser.add_argument("--directory", default=".", help="where <book>.bin files live")
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=15.0,
+        metavar="SECONDS",
+        help="rewrite the $CONTACTS_BOT_METRICS file every SECONDS",
+    )
+    if "CONTACTS_BOT_METRICS" in os.environ:
+        metrics.REGISTRY.exporters.append(
+            metrics.PrometheusTextFile(os.environ["CONTACTS_BOT_METRICS"])
+        )
+    asyncio.run(serve(parser.parse_args()))
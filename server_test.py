@@ -0,0 +1,136 @@
+import asyncio
+import os.path
+
+import metrics
+import server
+
+
+def run_with_server(tmp_path, scenario):
+    async def run():
+        path = str(tmp_path / "bot.sock")
+        bot_server = server.Server(str(tmp_path))
+        listener = await bot_server.start_unix(path)
+        async with listener:
+            result = await scenario(path)
+            for _ in range(500):
+                if not bot_server.registry.books and not bot_server.registry.saving:
+                    break
+                await asyncio.sleep(0.01)
+            return result
+
+    return asyncio.run(run())
+
+
+def test_shared_book(tmp_path):
+    async def scenario(path):
+        alice = await server.Client.connect("team", path=path)
+        bob = await server.Client.connect("team", path=path)
+        outputs = [
+            await alice.send("add John, 1234567899"),
+            await bob.send("phone John"),
+            await bob.send("add Jane, 9876543200"),
+            await alice.send("show all"),
+        ]
+        await alice.close()
+        await bob.close()
+        return outputs
+
+    assert run_with_server(tmp_path, scenario) == [
+        "John is added to Contacts",
+        "1234567899",
+        "Jane is added to Contacts",
+        "John: Phones: 1234567899\nJane: Phones: 9876543200",
+    ]
+
+
+def test_separate_scrolling_and_books(tmp_path):
+    async def scenario(path):
+        alice = await server.Client.connect("team", path=path)
+        for i in range(7):
+            await alice.send("add John %d, 1234567899" % i)
+        bob = await server.Client.connect("team", path=path)
+        carol = await server.Client.connect("private", path=path)
+        outputs = [
+            (await alice.send("show all")).count("\n"),
+            await bob.send("next"),
+            (await alice.send("next")).count("\n"),
+            await carol.send("show all"),
+            await carol.send("."),
+        ]
+        for client in (alice, bob, carol):
+            await client.close()
+        return outputs
+
+    assert run_with_server(tmp_path, scenario) == [
+        4,
+        "No scrolling context",
+        1,
+        "Contact book is empty",
+        None,
+    ]
+    assert os.path.exists(tmp_path / "team.bin")
+
+    async def reconnect(path):
+        client = await server.Client.connect("team", path=path)
+        output = await client.send("phone John 6")
+        await client.close()
+        return output
+
+    assert run_with_server(tmp_path, reconnect) == "1234567899"
+
+
+def test_invalid_book_name(tmp_path):
+    async def scenario(path):
+        reader, writer = await asyncio.open_unix_connection(path)
+        writer.write(b"../etc\n")
+        client = server.Client(reader, writer)
+        output = await client.receive()
+        await client.close()
+        return output
+
+    assert run_with_server(tmp_path, scenario) == (
+        "Please provide a valid address book name"
+    )
+
+
+def test_file_commands_are_not_served(tmp_path):
+    secret = tmp_path / "secret.csv"
+    secret.write_text("name,phones,birthday\nJohn,1234567899,\n")
+
+    async def scenario(path):
+        client = await server.Client.connect("team", path=path)
+        outputs = [
+            await client.send(f"import {secret}"),
+            await client.send(f"export {tmp_path / 'pwned.csv'}"),
+            await client.send("show all"),
+        ]
+        await client.close()
+        return outputs
+
+    assert run_with_server(tmp_path, scenario) == [
+        "Command import is not available on this server",
+        "Command export is not available on this server",
+        "Contact book is empty",
+    ]
+    assert not os.path.exists(tmp_path / "pwned.csv")
+
+
+def test_export_metrics(tmp_path):
+    path = tmp_path / "bot.prom"
+    registry = metrics.Metrics()
+    registry.exporters.append(metrics.PrometheusTextFile(str(path)))
+
+    async def run():
+        exporting = asyncio.ensure_future(server.export_metrics(registry, 0.01))
+        for _ in range(500):
+            if path.exists():
+                break
+            await asyncio.sleep(0.01)
+        exported = path.exists()
+        path.unlink()
+        exporting.cancel()
+        await asyncio.gather(exporting, return_exceptions=True)
+        return exported
+
+    assert asyncio.run(run())
+    assert path.exists()
@@ -0,0 +1,194 @@
+from collections.abc import MutableMapping
+import datetime
+import heapq
+import multiprocessing
+import os
+import zlib
+
+import address_book
+
+
+def _name(record):
+    return record.name.value
+
+
+OPERATIONS = {
+    "get": lambda book, name: book.data[name],
+    "put": lambda book, name, record: book.__setitem__(name, record),
+    "delete": lambda book, name: book.__delitem__(name),
+    "contains": lambda book, name: name in book.data,
+    "len": lambda book: len(book.data),
+    "values": lambda book: sorted(book.data.values(), key=_name),
+    "search": lambda book, value: sorted(book.search(value).iter, key=_name),
+    "search_phone": lambda book, phone: sorted(
+        book.search_record_by_phone(phone).iter, key=_name
+    ),
+    "upcoming": lambda book, days, today: list(
+        book.upcoming_birthdays(days, today).iter
+    ),
+    "bulk_add": lambda book, rows, batch_size: book.bulk_add(rows, batch_size),
+    "load": lambda book, store: book.read_from_file(store),
+    "save": lambda book, store: book.save_to_file(store),
+}
+
+
+def serve_shard(conn, store):
+    book = address_book.AddressBook()
+    book.read_from_file(store)
+    while True:
+        try:
+            method, args = conn.recv()
+        except EOFError:
+            break
+        if method == "close":
+            book.save_to_file(store)
+            conn.send((True, None))
+            break
+        if method in ("load", "save"):
+            args = (store,)
+        try:
+            conn.send((True, OPERATIONS[method](book, *args)))
+        except Exception as e:
+            conn.send((False, e))
+
+
+class Shard:
+    def __init__(self, store):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=serve_shard, args=(child, store), daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def send(self, method, *args):
+        self.conn.send((method, args))
+
+    def receive(self):
+        ok, result = self.conn.recv()
+        if not ok:
+            raise result
+        return result
+
+    def call(self, method, *args):
+        self.send(method, *args)
+        return self.receive()
+
+    def close(self):
+        if self.process.is_alive():
+            self.call("close")
+            self.process.join()
+
+
+class ShardedRecords(MutableMapping):
+    def __init__(self, shards):
+        self.shards = shards
+
+    def index(self, name) -> int:
+        key = str(getattr(name, "value", name)).encode()
+        return zlib.crc32(key) % len(self.shards)
+
+    def shard(self, name) -> Shard:
+        return self.shards[self.index(name)]
+
+    def gather(self, calls):
+        for shard, (method, args) in zip(self.shards, calls):
+            shard.send(method, *args)
+        return [shard.receive() for shard in self.shards]
+
+    def scatter(self, method, *args):
+        return self.gather([(method, args)] * len(self.shards))
+
+    def __getitem__(self, name) -> address_book.Record:
+        return self.shard(name).call("get", name)
+
+    def __setitem__(self, name, record: address_book.Record):
+        self.shard(name).call("put", name, record)
+
+    def __delitem__(self, name):
+        self.shard(name).call("delete", name)
+
+    def __contains__(self, name) -> bool:
+        return self.shard(name).call("contains", name)
+
+    def __len__(self) -> int:
+        return sum(self.scatter("len"))
+
+    def values(self):
+        return heapq.merge(*self.scatter("values"), key=_name)
+
+    def __iter__(self):
+        return (record.name for record in self.values())
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__}: {len(self.shards)} shards>"
+
+
+class ShardedAddressBook(address_book.AddressBook):
+    def __init__(self, path, shards=None, store_class=address_book.PickleStore):
+        super().__init__()
+        shards = shards or os.cpu_count() or 1
+        self.path = path
+        self.data = ShardedRecords(
+            [Shard(store_class(f"{path}.{i}")) for i in range(shards)]
+        )
+
+    def _merge(self, results, key=_name):
+        return address_book.AddressBookView(heapq.merge(*results, key=key))
+
+    def search_record_by_phone(self, phone) -> address_book.AddressBookView:
+        return self._merge(self.data.scatter("search_phone", phone))
+
+    def search(self, value: str) -> address_book.AddressBookView:
+        return self._merge(self.data.scatter("search", value))
+
+    def upcoming_birthdays(self, days: int, today=None) -> address_book.AddressBookView:
+        if today is None:
+            today = datetime.datetime.now().date()
+        return self._merge(
+            self.data.scatter("upcoming", days, today),
+            key=lambda r: address_book.next_birthday(r.birthday.value, today),
+        )
+
+    def bulk_add(self, rows, batch_size=1000):
+        partitions = [[] for _ in self.data.shards]
+        numbers = [[] for _ in self.data.shards]
+        for row_number, row in enumerate(rows, start=1):
+            i = self.data.index(row[0])
+            partitions[i].append(row)
+            numbers[i].append(row_number)
+        results = self.data.gather(
+            [("bulk_add", (rows, batch_size)) for rows in partitions]
+        )
+        added = 0
+        errors = []
+        for rows_numbers, (shard_added, shard_errors) in zip(numbers, results):
+            added += shard_added
+            errors += [(rows_numbers[row - 1], e) for row, e in shard_errors]
+        errors.sort(key=lambda error: error[0])
+        return added, errors
+
+    def read_from_file(self, store=None):
+        self.data.scatter("load")
+        self._indexes = {}
+        self._fuzzy_build = None
+        self._cache.invalidate()
+        self.changes = set()
+
+    def save_to_file(self, store=None):
+        changes, self.changes = self.changes, set()
+        try:
+            self.data.scatter("save")
+        except:
+            self.changes |= changes
+            raise
+
+    def close(self):
+        for shard in self.data.shards:
+            shard.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
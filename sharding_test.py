@@ -0,0 +1,70 @@
+import datetime
+
+import address_book
+import bot
+import sharding
+
+
+def names(view):
+    return [str(record.name) for page in view for record in page]
+
+
+def test_sharded_address_book(tmp_path):
+    path = str(tmp_path / "contacts")
+    with sharding.ShardedAddressBook(path, shards=3) as book:
+        added, errors = book.bulk_add(
+            [
+                ("John %d" % i, ["12345678%02d" % (i % 3)], "%02d/05/1990" % (i + 1))
+                for i in range(20)
+            ]
+            + [("John 0", [], None), ("Jane", ["123"], None)]
+        )
+        assert added == 20
+        assert [row for row, _ in errors] == [21, 22]
+        assert len(book) == 20
+        assert names(book.search("John 1")) == ["John 1"] + [
+            "John %d" % i for i in range(10, 20)
+        ]
+        assert names(book.search_record_by_phone("1234567802")) == [
+            "John %d" % i for i in sorted(range(2, 20, 3), key=str)
+        ]
+        upcoming = book.upcoming_birthdays(2, today=datetime.date(2023, 5, 4))
+        assert names(upcoming) == ["John 3", "John 4", "John 5"]
+
+        book.get_record("John 7").add_phone(address_book.Phone("5555555555"))
+        book.delete_record(address_book.Name("John 8"))
+        assert names(book.search_record_by_phone("5555555555")) == ["John 7"]
+        assert book.dirty
+        book.save_to_file()
+        assert not book.dirty
+        book.get_record("John 7").set_birthday(address_book.Birthday("08/05/1990"))
+        book.read_from_file()
+        assert not book.dirty
+
+    with sharding.ShardedAddressBook(path, shards=3) as book:
+        assert len(book) == 19
+        assert str(book.get_record("John 7")) == (
+            "John 7: Phones: 1234567801, 5555555555, Birthday: 08/05/1990"
+        )
+
+
+def test_sharded_bot_commands(tmp_path):
+    with sharding.ShardedAddressBook(str(tmp_path / "contacts"), shards=2) as book:
+        session = bot.Bot(book)
+        outputs = [
+            bot.execute(session, command)[0]
+            for command in [
+                "add John, 1234567899",
+                "add Jane, 9876543200",
+                "add John, 1234567899",
+                "show all",
+                "phone Mary",
+            ]
+        ]
+    assert outputs == [
+        "John is added to Contacts",
+        "Jane is added to Contacts",
+        "John already exists",
+        "Jane: Phones: 9876543200\nJohn: Phones: 1234567899",
+        "<Name: Mary> doesn't exist",
+    ]